@@ -0,0 +1,59 @@
+import os
+import asyncio
+import time
+import numpy as np
+from libsumo_parallel import *
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+N_STEPS = 300
+DISTANCE = 250
+INSTANCES = (1, 2, 4)
+
+
+def run_town_cosim(seed, n_steps=N_STEPS):
+    """
+        Runs a co-simulation with the blocking connection and returns the number of micro vehicles of each step.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE)
+    log_veh_count = [returns[0] for step_time, returns in town_steps(parallel_conn, network, edges, n_steps)]
+    parallel_conn.close()
+    return log_veh_count
+
+
+async def run_town_cosim_async(seed, n_steps=N_STEPS):
+    """
+        Runs a co-simulation with the asyncio connection and returns the number of micro vehicles of each step.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(
+        seed, connection_class=AsyncLibsumoParallelConnection)
+    await parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE)
+    log_veh_count = []
+    for i in range(n_steps):
+        parallel_conn.set_callback_arguments(('ego', i == 0, edges), True)
+        await parallel_conn.simulation_step(network)
+        log_veh_count.append((await parallel_conn.get_callback_returns(True))[0])
+    await parallel_conn.close()
+    return log_veh_count
+
+
+async def run_concurrently(n):
+    return await asyncio.gather(*(run_town_cosim_async(seed) for seed in range(n)))
+
+
+def main():
+    print(f"Town co-simulations, {N_STEPS} steps each, distance = {DISTANCE} m, {os.cpu_count()} CPUs:")
+    for n in INSTANCES:
+        t1 = time.perf_counter()
+        sequential = [run_town_cosim(seed) for seed in range(n)]
+        sequential_time = time.perf_counter() - t1
+        t1 = time.perf_counter()
+        concurrent = asyncio.run(run_concurrently(n))
+        concurrent_time = time.perf_counter() - t1
+        print(f"  {n} instance(s): sequential, blocking = {sequential_time:6.2f} s, one event loop = "
+              f"{concurrent_time:6.2f} s (x{sequential_time / concurrent_time:4.2f}), micro vehicles mean = "
+              f"{np.mean(sequential):6.1f} / {np.mean(concurrent):6.1f}")
+
+
+if __name__ == "__main__":
+    main()
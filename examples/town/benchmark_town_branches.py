@@ -0,0 +1,80 @@
+import sys, os
+import random
+import time
+import numpy as np
+from simulate_town_cosim import micro_callback
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+WARMUP_STEPS = 1800
+BRANCH_STEPS = 300
+N_BRANCHES = 8
+DISTANCE = 250
+
+
+def branch_callback(ego_id, init, edges, seed=None):
+
+    # The random EGO routes are drawn in the micro worker, so the branch seed is set there, with the first step
+    if seed is not None:
+        random.seed(seed)
+    return micro_callback(ego_id, init, edges)
+
+
+def run_branch(parallel_conn, seed):
+    """
+        Continues the co-simulation from the checkpoint with a random EGO route, seeded in the micro worker, and
+        returns the micro vehicle counts and the EGO speeds.
+    """
+    network = run_branch.network
+    log_veh_count = []
+    log_ego_speed = []
+    for i in range(BRANCH_STEPS):
+        parallel_conn.set_callback_arguments(('ego', False, run_branch.edges, seed if i == 0 else None), True)
+        parallel_conn.simulation_step(network)
+        veh_count, ego_speed, changed_lane, headway = parallel_conn.get_callback_returns(True)
+        log_veh_count.append(veh_count)
+        log_ego_speed.append(ego_speed)
+    return log_veh_count, log_ego_speed
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    checkpoint_path = script_dir + "/results/town_warmup.pkl"
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(0, (branch_callback, None))
+    run_branch.network = network
+    run_branch.edges = edges
+
+    # Cold start: the network and the routes are loaded and the meso network is warmed up
+    t1 = time.perf_counter()
+    cold_start = parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE)['total']
+    for _ in town_steps(parallel_conn, network, edges, WARMUP_STEPS):
+        pass
+    warmup_time = time.perf_counter() - t1
+    t1 = time.perf_counter()
+    parallel_conn.save_state(checkpoint_path)
+    save_time = time.perf_counter() - t1
+
+    # The branches continue from the checkpoint with other SUMO seeds and EGO routes
+    t1 = time.perf_counter()
+    results, timing = parallel_conn.run_branches(checkpoint_path, run_branch, range(N_BRANCHES),
+                                                 seeds=range(1, N_BRANCHES + 1))
+    branches_time = time.perf_counter() - t1
+    parallel_conn.close()
+
+    restore_times = np.array([branch_timing['total'] for branch_timing in timing])
+    print(f"Town co-simulation, {WARMUP_STEPS} warm-up steps, {N_BRANCHES} branches of {BRANCH_STEPS} steps, "
+          f"distance = {DISTANCE} m, {os.cpu_count()} CPUs:")
+    print(f"  cold start = {cold_start:6.2f} s, with warm-up = {warmup_time:6.2f} s, checkpoint = {save_time:6.3f} s")
+    print(f"  restore = {np.mean(restore_times):6.2f} s mean (start {np.mean([t['meso_load'] for t in timing]):5.2f} s, "
+          f"state of the connection {np.mean([t['restore'] for t in timing]) * 1e3:5.1f} ms), "
+          f"x{warmup_time / np.mean(restore_times):5.1f} faster than the cold start with warm-up")
+    print(f"  {N_BRANCHES} branches = {branches_time:6.2f} s, estimated from t = 0: "
+          f"{branches_time + (N_BRANCHES * warmup_time - np.sum(restore_times)):6.2f} s")
+    for seed, (veh_counts, ego_speeds) in enumerate(results):
+        # The EGO speed is invalid in the steps when the callback adds the EGO again, before it departed
+        ego_speeds = np.array(ego_speeds)
+        print(f"  branch {seed}: micro vehicles mean = {np.mean(veh_counts):6.1f}, "
+              f"EGO speed mean = {np.mean(ego_speeds[ego_speeds >= 0]):5.2f} m/s")
+
+
+if __name__ == "__main__":
+    main()
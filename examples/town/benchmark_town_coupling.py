@@ -0,0 +1,59 @@
+import time
+import numpy as np
+from benchmark_town_subgraph import create_town_cosim, town_steps
+from evaluate_results import create_cdf, create_headway
+
+N_SUMO_STEPS = 1800
+DISTANCE = 250
+COUPLING_INTERVALS = (1, 2, 5, 10)
+
+
+def run_town_cosim(coupling_interval, n_sumo_steps=N_SUMO_STEPS, seed=0):
+    """
+        Runs the town co-simulation for the given number of SUMO steps and returns the run time, the EGO speeds and the
+        headways logged at each exchange.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE, coupling_interval=coupling_interval)
+
+    log_ego_speed = []
+    log_headway = []
+    t1 = time.perf_counter()
+    n_steps = n_sumo_steps // coupling_interval
+    for step_time, (veh_count, ego_speed, changed_lane, headway) in town_steps(parallel_conn, network, edges, n_steps):
+        log_ego_speed.append(ego_speed)
+        log_headway.append(headway)
+    run_time = time.perf_counter() - t1
+
+    parallel_conn.close()
+    return run_time, log_ego_speed, log_headway
+
+
+def cdf_distance(cdf, reference):
+    """
+        Largest difference between two CDFs (Kolmogorov-Smirnov distance).
+    """
+    return np.max(np.abs(np.asarray(cdf) - np.asarray(reference)))
+
+
+def main():
+    results = {k: run_town_cosim(k) for k in COUPLING_INTERVALS}
+    # The difference between two seeds with full coupling shows the run-to-run variation of the metrics
+    results['1, seed 1'] = run_town_cosim(1, seed=1)
+
+    reference_time, reference_speed, reference_headway = results[1]
+    reference_speed_cdf = create_cdf(reference_speed, 30)
+    reference_headway_cdf = create_cdf(create_headway(reference_headway)[0], 150)
+
+    print(f"Town co-simulation, {N_SUMO_STEPS} SUMO steps, distance = {DISTANCE} m, CDF distances from k = 1:")
+    for k, (run_time, ego_speed, headway) in results.items():
+        headway, no_leader = create_headway(headway)
+        speed_distance = cdf_distance(create_cdf(ego_speed, 30), reference_speed_cdf)
+        headway_distance = cdf_distance(create_cdf(headway, 150), reference_headway_cdf)
+        print(f"  k = {str(k):>9}: {N_SUMO_STEPS / run_time:7.1f} steps/s (x{reference_time / run_time:4.2f}), "
+              f"EGO speed CDF distance = {speed_distance:5.3f}, headway CDF distance = {headway_distance:5.3f}, "
+              f"no leader = {no_leader / len(ego_speed) * 100:5.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+from libsumo_parallel import *
+from simulate_town_cosim import micro_callback
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+N_STEPS = 1000
+DISTANCES = (250, 1000)
+
+
+def loop_callback(ego_id, init, edges):
+    veh_count, ego_speed, changed_lane, headway = micro_callback(ego_id, init, edges)
+    # The vehicle states are read one by one
+    t1 = time.perf_counter()
+    positions = []
+    speeds = []
+    roads = []
+    lanes = []
+    for veh in libsumo.vehicle.getIDList():
+        positions.append(libsumo.vehicle.getPosition(veh))
+        speeds.append(libsumo.vehicle.getSpeed(veh))
+        roads.append(libsumo.vehicle.getRoadID(veh))
+        lanes.append(libsumo.vehicle.getLaneIndex(veh))
+    mean_speed = np.mean(speeds) if speeds else 0.0
+    return len(speeds), mean_speed, time.perf_counter() - t1
+
+
+def frame_callback(ego_id, init, edges, frame):
+    veh_count, ego_speed, changed_lane, headway = micro_callback(ego_id, init, edges)
+    # The vehicle states are read from the frame, which was filled before the callback
+    t1 = time.perf_counter()
+    positions = frame.positions
+    speeds = frame.speeds
+    roads = frame.edges
+    lanes = frame.lanes
+    mean_speed = np.mean(speeds) if len(frame) else 0.0
+    return len(frame), mean_speed, time.perf_counter() - t1
+
+
+def run_town_cosim(use_frame, distance, n_steps=N_STEPS, seed=0):
+    """
+        Runs the town co-simulation with a single EGO and returns the time of reading the vehicle states in each step
+        (with the frame, filling the frame included) and the number of micro vehicles.
+    """
+    callbacks = (frame_callback if use_frame else loop_callback, None)
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed, callbacks)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', distance, micro_vehicle_frame=use_frame,
+                        profile_capacity=N_STEPS * 20)
+
+    log_read_time = []
+    log_veh_count = []
+    for step_time, (veh_count, mean_speed, read_time) in town_steps(parallel_conn, network, edges, n_steps):
+        log_read_time.append(read_time)
+        log_veh_count.append(veh_count)
+
+    parallel_conn.close()
+    read_time = np.mean(log_read_time)
+    if use_frame:
+        read_time += parallel_conn.get_profile_summary()['micro']['frame']['mean']
+    return read_time, np.array(log_veh_count)
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, reading the micro vehicle states in the callback:")
+    for distance in DISTANCES:
+        for use_frame in (False, True):
+            read_time, veh_counts = run_town_cosim(use_frame, distance)
+            name = 'VehicleStateFrame' if use_frame else 'getter per vehicle'
+            print(f"  {distance:5d} m, {name:>18}: {read_time * 1e6:8.1f} us/step, "
+                  f"{read_time / np.mean(veh_counts) * 1e6:6.2f} us/vehicle, "
+                  f"micro vehicles mean = {np.mean(veh_counts):6.1f}")
+
+
+if __name__ == "__main__":
+    main()
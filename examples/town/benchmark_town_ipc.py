@@ -0,0 +1,233 @@
+import sys, os
+import random
+import time
+import multiprocessing as mp
+import numpy as np
+from libsumo_parallel import *
+
+N_STEPS = 2000
+N_SUBGRAPH = 150
+N_INFLOW = 30
+N_NEW_LINKS = 10
+N_HANDOFF = 20
+N_EGOS = 3
+
+
+def step_payloads(edges, step):
+    """
+        Builds a synthetic, town-sized set of values that are exchanged in one co-simulation step.
+    """
+    rnd = random.Random(step)
+    subgraph = rnd.sample(edges, N_SUBGRAPH)
+    inflow = subgraph[:N_INFLOW]
+    new_links = subgraph[-N_NEW_LINKS:]
+    meso_routes = [(f'veh_{step}_{i}', rnd.sample(edges, 12)) for i in range(N_HANDOFF)]
+    prev_inflow_ids = [(edge, [f'veh_{step}_{i}' for i in range(3)]) for edge in inflow]
+    ego_pos = [(rnd.uniform(0, 3000), rnd.uniform(0, 3000)) for _ in range(N_EGOS)]
+    callback_args = ('ego', False, edges)
+    callback_return = (120, 13.9, 0, ('leader', 25.0))
+    return subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, callback_args, callback_return
+
+
+def intern_payloads(payloads, edge_index, vehicle_index):
+    """
+        Replaces the edge and vehicle IDs of the step values by their indices in the edge and vehicle tables.
+    """
+    subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, callback_args, callback_return = payloads
+    subgraph = [edge_index[edge] for edge in subgraph]
+    inflow = [edge_index[edge] for edge in inflow]
+    new_links = [edge_index[edge] for edge in new_links]
+    meso_routes = [(vehicle_index.add(veh), [edge_index[edge] for edge in route]) for veh, route in meso_routes]
+    prev_inflow_ids = [(edge_index[edge], [vehicle_index.add(veh) for veh in vehs]) for edge, vehs in prev_inflow_ids]
+    return subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, callback_args, callback_return
+
+
+def worker_manager(values, step, done, payloads):
+    while True:
+        step.wait()
+        step.clear()
+        if values['stop']:
+            break
+        subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, _, callback_return = \
+            payloads[values['step']]
+        list(values['subgraph'])
+        list(values['inflow'])
+        list(values['new_links'])
+        values['meso_routes'] = meso_routes
+        values['meso_routes']
+        values['callback_micro_arguments']
+        values['callback_micro_return'] = callback_return
+        values['prev_inflow_ids'] = dict(prev_inflow_ids)
+        values['ego_pos'] = ego_pos
+        done.set()
+
+
+def worker_channel(channel, step, done, payloads, counter):
+    while True:
+        step.wait()
+        step.clear()
+        if counter.value < 0:
+            break
+        subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, _, callback_return = \
+            payloads[counter.value]
+        channel.read_ids('subgraph')
+        channel.read_ids('inflow')
+        channel.read_ids('new_links')
+        channel.write_records('meso_routes', meso_routes)
+        channel.read_records('meso_routes')
+        channel.read_object('callback_micro_arguments')
+        channel.write_object('callback_micro_return', callback_return)
+        channel.write_records('prev_inflow_ids', prev_inflow_ids)
+        channel.write_floats('ego_pos', ego_pos)
+        done.set()
+    channel.close()
+
+
+def worker_interned(channel, step, done, payloads, counter):
+    while True:
+        step.wait()
+        step.clear()
+        if counter.value < 0:
+            break
+        subgraph, inflow, new_links, meso_routes, prev_inflow_ids, ego_pos, _, callback_return = \
+            payloads[counter.value]
+        channel.read_ints('subgraph')
+        channel.read_ints('inflow')
+        channel.read_ints('new_links')
+        channel.write_int_records('meso_routes', meso_routes)
+        channel.read_int_records('meso_routes')
+        channel.read_object('callback_micro_arguments')
+        channel.write_object('callback_micro_return', callback_return)
+        channel.write_int_records('prev_inflow_ids', prev_inflow_ids)
+        channel.write_floats('ego_pos', ego_pos)
+        done.set()
+    channel.close()
+
+
+def bench_manager(payloads):
+    manager = mp.Manager()
+    values = manager.dict()
+    values['stop'] = False
+    values['step'] = 0
+    step, done = mp.Event(), mp.Event()
+    proc = mp.Process(target=worker_manager, args=(values, step, done, payloads))
+    proc.start()
+    step_times = []
+    for i in range(N_STEPS):
+        subgraph, inflow, new_links, _, _, _, callback_args, _ = payloads[i]
+        t1 = time.perf_counter()
+        values['step'] = i
+        values['subgraph'] = subgraph
+        values['inflow'] = inflow
+        values['new_links'] = new_links
+        values['callback_micro_arguments'] = callback_args
+        step.set()
+        done.wait()
+        done.clear()
+        values['callback_micro_return']
+        values['ego_pos']
+        step_times.append(time.perf_counter() - t1)
+    values['stop'] = True
+    step.set()
+    proc.join()
+    manager.shutdown()
+    return np.array(step_times), None
+
+
+def bench_channel(payloads, interned=False):
+    if interned:
+        regions = {'subgraph': 'ints', 'inflow': 'ints', 'new_links': 'ints', 'meso_routes': 'int_records',
+                   'prev_inflow_ids': 'int_records'}
+        write_ids = SharedStepChannel.write_ints
+    else:
+        regions = {'subgraph': 'ids', 'inflow': 'ids', 'new_links': 'ids', 'meso_routes': 'records',
+                   'prev_inflow_ids': 'records'}
+        write_ids = SharedStepChannel.write_ids
+    channel = SharedStepChannel(dict(regions, ego_pos='floats', callback_micro_arguments='object',
+                                     callback_micro_return='object'))
+    counter = mp.Value('i', 0, lock=False)
+    step, done = mp.Event(), mp.Event()
+    proc = mp.Process(target=worker_interned if interned else worker_channel,
+                      args=(channel, step, done, payloads, counter))
+    proc.start()
+    step_times = []
+    for i in range(N_STEPS):
+        subgraph, inflow, new_links, _, _, _, callback_args, _ = payloads[i]
+        t1 = time.perf_counter()
+        counter.value = i
+        write_ids(channel, 'subgraph', subgraph)
+        write_ids(channel, 'inflow', inflow)
+        write_ids(channel, 'new_links', new_links)
+        channel.write_object('callback_micro_arguments', callback_args)
+        step.set()
+        done.wait()
+        done.clear()
+        channel.read_object('callback_micro_return')
+        channel.read_floats('ego_pos')
+        step_times.append(time.perf_counter() - t1)
+    counter.value = -1
+    step.set()
+    proc.join()
+    step_bytes = sum(channel.bytes_written().values()) / N_STEPS
+    channel.close(unlink=True)
+    return np.array(step_times), step_bytes
+
+
+def worker_baseline(step, done, counter):
+    while True:
+        step.wait()
+        step.clear()
+        if counter.value < 0:
+            break
+        done.set()
+
+
+def bench_baseline():
+    counter = mp.Value('i', 0, lock=False)
+    step, done = mp.Event(), mp.Event()
+    proc = mp.Process(target=worker_baseline, args=(step, done, counter))
+    proc.start()
+    step_times = []
+    for i in range(N_STEPS):
+        t1 = time.perf_counter()
+        counter.value = i
+        step.set()
+        done.wait()
+        done.clear()
+        step_times.append(time.perf_counter() - t1)
+    counter.value = -1
+    step.set()
+    proc.join()
+    return np.array(step_times)
+
+
+def main():
+
+    # Get the road network as graph
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    network_path = script_dir + "/town_scenario/town.net.xml"
+    network = LibsumoParallelConnection.parse_network(network_path)
+    edges = []
+    for e in network.getEdges():
+        edges.append(e.getID())
+
+    # The payloads are generated before the measurement, the synchronization cost is measured separately and
+    # subtracted
+    payloads = [step_payloads(edges, i) for i in range(N_STEPS)]
+    edge_index = {edge: i for i, edge in enumerate(sorted(edges))}
+    vehicle_index = IdTable()
+    interned_payloads = [intern_payloads(values, edge_index, vehicle_index) for values in payloads]
+    baseline = bench_baseline()
+    results = {'manager dict': bench_manager(payloads), 'shared memory channel': bench_channel(payloads),
+               'interned channel': bench_channel(interned_payloads, interned=True)}
+
+    print(f"Per-step IPC latency over {N_STEPS} steps (synchronization subtracted):")
+    for name, (step_times, step_bytes) in results.items():
+        ipc = (step_times - np.median(baseline)) * 1e6
+        transferred = '' if step_bytes is None else f", shared memory written = {step_bytes:8.0f} B/step"
+        print(f"  {name:>22}: mean = {np.mean(ipc):8.1f} us, p50 = {np.percentile(ipc, 50):8.1f} us, "
+              f"p99 = {np.percentile(ipc, 99):8.1f} us{transferred}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import random
+import time
+import numpy as np
+from libsumo_parallel import *
+from benchmark_town_subgraph import create_town_cosim
+
+N_STEPS = 600
+DISTANCE = 250
+N_EGOS = 8
+WORKERS = (1, 2, 4, 8)
+
+
+def micro_callback(ego_ids, edges, start_edges):
+
+    # Send the EGOs of this worker to a random target when they are close to the end of their route. At the first
+    # step, every EGO is in the first worker. EGOs that left the simulation are added again on their start edge.
+    for ego_id in ego_ids:
+        try:
+            current_route = libsumo.vehicle.getRoute(ego_id)
+            current_edge = libsumo.vehicle.getRoadID(ego_id)
+        except libsumo.TraCIException:
+            if ego_id + '_route' not in libsumo.route.getIDList():
+                libsumo.route.add(ego_id + '_route', [start_edges[ego_id]])
+            libsumo.vehicle.add(ego_id, ego_id + '_route')
+            current_route = libsumo.vehicle.getRoute(ego_id)
+            current_edge = ''
+        if len(current_route) < 3 or current_edge in current_route[-2:]:
+            for _ in range(10):
+                try:
+                    libsumo.vehicle.changeTarget(ego_id, random.choice(edges))
+                except libsumo.TraCIException:
+                    continue
+                if len(libsumo.vehicle.getRoute(ego_id)) > 2:
+                    break
+
+    return len(libsumo.vehicle.getIDList())
+
+
+def spread_edges(network, n):
+    """
+        Selects n edges that are far from each other (farthest point sampling of the edge start positions).
+    """
+    edges = [e for e in network.getEdges() if e.getLength() > 50]
+    points = np.array([e.getShape()[0] for e in edges])
+    selected = [0]
+    distances = np.hypot(*(points - points[0]).T)
+    for _ in range(n - 1):
+        selected.append(int(np.argmax(distances)))
+        distances = np.minimum(distances, np.hypot(*(points - points[selected[-1]]).T))
+    return [edges[i].getID() for i in selected]
+
+
+def run_town_cosim(micro_workers, n_steps=N_STEPS, seed=0):
+    """
+        Runs the town co-simulation with scattered EGOs and returns the step times, the number of micro vehicles and
+        the number of EGOs of each worker at the end.
+    """
+    micro = True
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(
+        seed, (micro_callback, None), connection_kwargs={'micro_workers': micro_workers})
+    ego_ids = [f'ego_{i}' for i in range(N_EGOS)]
+    start_edges = dict(zip(ego_ids, spread_edges(network, N_EGOS)))
+    parallel_conn.start(micro_cmd, meso_cmd, ego_ids, DISTANCE)
+
+    log_step_time = []
+    log_veh_count = []
+    for i in range(n_steps):
+        t1_step = time.perf_counter()
+        for worker, worker_egos in enumerate(parallel_conn.get_island_egos()):
+            parallel_conn.set_callback_arguments((worker_egos, edges, start_edges), micro, worker)
+        parallel_conn.simulation_step(network)
+        log_step_time.append(time.perf_counter() - t1_step)
+        log_veh_count.append(sum(parallel_conn.get_callback_returns(micro, worker) for worker in range(micro_workers)))
+
+    island_egos = parallel_conn.get_island_egos()
+    parallel_conn.close()
+    return np.array(log_step_time), np.array(log_veh_count), [len(worker_egos) for worker_egos in island_egos]
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, {N_EGOS} scattered EGOs, distance = {DISTANCE} m, "
+          f"{os.cpu_count()} CPUs:")
+    reference = None
+    for micro_workers in WORKERS:
+        step_times, veh_counts, island_egos = run_town_cosim(micro_workers)
+        # The first steps are skipped, the EGOs are moved to their workers after the first step
+        steps_per_second = 1 / np.mean(step_times[10:])
+        reference = reference or steps_per_second
+        print(f"  {micro_workers} micro worker(s): {steps_per_second:7.1f} steps/s (x{steps_per_second / reference:4.2f}), "
+              f"p99 step time = {np.percentile(step_times[10:], 99) * 1e3:6.2f} ms, "
+              f"micro vehicles mean = {np.mean(veh_counts):6.1f}, EGOs per worker = {island_egos}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from benchmark_town_subgraph import run_town_cosim, print_summary, DISTANCE
+
+N_STEPS = 1000
+LOOKAHEAD_HORIZON = 10.0  # s
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, distance = {DISTANCE} m:")
+    for mode in ('circle', 'road'):
+        results = run_town_cosim(N_STEPS, start_kwargs={'subgraph_mode': mode})
+        print_summary(mode, *results)
+        results = run_town_cosim(N_STEPS, start_kwargs={'subgraph_mode': mode,
+                                                        'lookahead_horizon': LOOKAHEAD_HORIZON})
+        print_summary(mode + ' with lookahead', *results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys, os
+import time
+import resource
+import multiprocessing as mp
+import numpy as np
+from libsumo_parallel import *
+
+N_QUERIES = 1000
+DISTANCE = 250
+
+
+def load_network(network_path, loader, conn):
+    """
+        Loads the network in a fresh process and reports the load time, the growth of the peak RSS and the time of the
+        neighbouring edge queries around random edges.
+    """
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t1 = time.perf_counter()
+    if loader == 'sumolib':
+        network = readNet(network_path)
+    else:
+        network = LibsumoParallelConnection.load_network_index(network_path, cache=(loader == 'index'))
+        if network.load_statistics['cached']:
+            loader += ', cache hit'
+        elif loader == 'index':
+            loader += ', cache miss'
+    load_time = time.perf_counter() - t1
+    rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    rng = np.random.default_rng(0)
+    edges = network.getEdges()
+    points = [edges[i].getShape()[0] for i in rng.integers(len(edges), size=N_QUERIES)]
+    t1 = time.perf_counter()
+    for x, y in points:
+        network.getNeighboringEdges(x, y, DISTANCE, includeJunctions=True)
+    query_time = (time.perf_counter() - t1) / N_QUERIES
+    conn.send((loader, load_time, rss, query_time))
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    network_path = script_dir + "/town_scenario/town.net.xml"
+
+    # The first load with cache writes the cache file if there is none, so the index is loaded twice
+    print(f"Network loading, peak RSS growth and {N_QUERIES} getNeighboringEdges queries ({DISTANCE} m):")
+    for loader in ('sumolib', 'index, no cache', 'index', 'index'):
+        recv_conn, send_conn = mp.Pipe(duplex=False)
+        proc = mp.Process(target=load_network, args=(network_path, loader, send_conn))
+        proc.start()
+        loader, load_time, rss, query_time = recv_conn.recv()
+        proc.join()
+        print(f"  {loader:>18}: load time = {load_time * 1e3:8.1f} ms, peak RSS growth = {rss:7.1f} MB, "
+              f"query time = {query_time * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import time
+import numpy as np
+from simulate_town_cosim import micro_callback
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+N_STEPS = 600
+DISTANCE = 250
+LOG_DELAY = 0.002
+REPEATS = 2
+
+
+def log_callback(frame=None):
+
+    # Logging callback, only reads the vehicle states and stands for slow I/O with a sleep
+    time.sleep(LOG_DELAY)
+    return len(frame), float(np.mean(frame.speeds)) if len(frame) else 0.0
+
+
+def run_town_cosim(mode, n_steps=N_STEPS, seed=0):
+    """
+        Runs the town co-simulation with a logging callback in the meso worker and returns the step times and the logged
+        values.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(
+        seed, (micro_callback, log_callback), connection_kwargs={'meso_callback_mode': mode})
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE, meso_vehicle_frame=True)
+
+    log_step_time = []
+    log_returns = []
+    for step_time, micro_returns in town_steps(parallel_conn, network, edges, n_steps):
+        log_step_time.append(step_time)
+        log_returns.append(parallel_conn.get_callback_returns(False))
+
+    # The returns of the observe callbacks are futures, the last ones are collected when they are read
+    log_returns = [r.result() if mode == 'observe' else r for r in log_returns]
+    parallel_conn.close()
+    return np.array(log_step_time), log_returns
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, distance = {DISTANCE} m, meso logging callback of "
+          f"{LOG_DELAY * 1e3:.0f} ms, {os.cpu_count()} CPUs, best of {REPEATS} runs:")
+    for mode in ('control', 'observe'):
+        runs = [run_town_cosim(mode) for _ in range(REPEATS)]
+        step_times, returns = min(runs, key=lambda run: np.sum(run[0]))
+        print(f"  {mode:>7}: {1 / np.mean(step_times):7.1f} steps/s, "
+              f"p50 step time = {np.percentile(step_times, 50) * 1e3:6.2f} ms, "
+              f"p99 = {np.percentile(step_times, 99) * 1e3:6.2f} ms, "
+              f"meso vehicles mean = {np.mean([r[0] for r in returns]):6.1f}")
+
+
+if __name__ == "__main__":
+    main()
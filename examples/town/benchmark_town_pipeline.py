@@ -0,0 +1,49 @@
+import os
+import time
+import numpy as np
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+N_STEPS = 1000
+DISTANCE = 250
+REPEATS = 2
+
+
+def run_town_cosim(pipelined, n_steps=N_STEPS, seed=0, start_kwargs=None):
+    """
+        Runs the town co-simulation with a single EGO and returns the run time, the step times and the micro vehicle
+        counts.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE, pipelined=pipelined, **(start_kwargs or {}))
+
+    log_step_time = []
+    log_veh_count = []
+    t1 = time.perf_counter()
+    for step_time, (veh_count, ego_speed, changed_lane, headway) in town_steps(parallel_conn, network, edges, n_steps):
+        log_step_time.append(step_time)
+        log_veh_count.append(veh_count)
+    run_time = time.perf_counter() - t1
+
+    parallel_conn.close()
+    return run_time, np.array(log_step_time), np.array(log_veh_count)
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, distance = {DISTANCE} m, {os.cpu_count()} CPUs, "
+          f"best of {REPEATS} runs:")
+    for name, start_kwargs in (('circle', None), ('road', {'subgraph_mode': 'road'})):
+        results = dict()
+        for pipelined in (False, True):
+            runs = [run_town_cosim(pipelined, start_kwargs=start_kwargs) for _ in range(REPEATS)]
+            results[pipelined] = min(runs, key=lambda run: run[0])
+        reference_time = results[False][0]
+        for pipelined, (run_time, step_times, veh_counts) in results.items():
+            mode = 'pipelined' if pipelined else 'sequential'
+            print(f"  {name:>6}, {mode:>10}: {N_STEPS / run_time:7.1f} steps/s (x{reference_time / run_time:4.2f}), "
+                  f"p50 step time = {np.percentile(step_times, 50) * 1e3:6.2f} ms, "
+                  f"p99 = {np.percentile(step_times, 99) * 1e3:6.2f} ms, "
+                  f"micro vehicles mean = {np.mean(veh_counts):6.1f}")
+
+
+if __name__ == "__main__":
+    main()
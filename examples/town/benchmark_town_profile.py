@@ -0,0 +1,51 @@
+import sys, os
+import time
+from benchmark_town_subgraph import create_town_cosim, town_steps
+
+N_STEPS = 1000
+DISTANCE = 250
+PROFILE_CAPACITY = 100000
+REPEATS = 5
+
+
+def run_town_cosim(profile_capacity, n_steps=N_STEPS, seed=0):
+    """
+        Runs the town co-simulation with a single EGO and returns the run time and the closed connection, which keeps
+        the phase records.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', DISTANCE, profile_capacity=profile_capacity)
+
+    t1 = time.perf_counter()
+    for _ in town_steps(parallel_conn, network, edges, n_steps):
+        pass
+    run_time = time.perf_counter() - t1
+
+    parallel_conn.close()
+    return run_time, parallel_conn
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    trace_path = script_dir + "/results/town_cosim_trace.json"
+
+    # The runs with and without profiler are interleaved and the fastest ones are compared, the run times vary a lot
+    reference_times = []
+    profiled_times = []
+    for _ in range(REPEATS):
+        reference_times.append(run_town_cosim(0)[0])
+        run_time, parallel_conn = run_town_cosim(PROFILE_CAPACITY)
+        profiled_times.append(run_time)
+
+    print(f"Town co-simulation, {N_STEPS} steps, distance = {DISTANCE} m, phase durations:")
+    parallel_conn.export_profile_summary()
+    parallel_conn.export_profile_trace(trace_path)
+    print(f"Trace written to {trace_path}")
+    reference_time = min(reference_times)
+    profiled_time = min(profiled_times)
+    print(f"Run time without profiler = {reference_time:6.2f} s, with profiler = {profiled_time:6.2f} s "
+          f"({(profiled_time / reference_time - 1) * 100:+5.1f} %), best of {REPEATS} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import sys, os
+import math
+import time
+import numpy as np
+from libsumo_parallel import *
+
+N_WARMUP_STEPS = 600
+N_STEPS = 300
+DISTANCE = 100
+N_EGOS = (1, 3, 20, 50)
+
+
+def out_of_range_per_vehicle(subgraph, ego_ids, ego_pos, radius):
+    """
+        The removal scan as it was before: two TraCI calls per vehicle and a Python loop over the EGOs.
+    """
+    selected = []
+    for veh in libsumo.vehicle.getIDList():
+        if veh in ego_ids:
+            continue
+        edge_id = libsumo.vehicle.getRoadID(veh)
+        if edge_id in subgraph:
+            continue
+        x2, y2 = libsumo.vehicle.getPosition(veh)
+        out_of_range = []
+        for x, y in ego_pos:
+            out_of_range.append(math.sqrt((x2 - x) ** 2 + (y2 - y) ** 2) > radius)
+        if all(out_of_range):
+            selected.append(veh)
+    return selected
+
+
+def main():
+
+    # Full microsimulation of the town, so there are several hundred vehicles to scan
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sumo_cmd = ["sumo", "-c", script_dir + "/town_scenario/town.sumocfg", "--seed", "0"]
+    network = LibsumoParallelConnection.load_network_index(script_dir + "/town_scenario/town.net.xml")
+    libsumo.start(sumo_cmd)
+    for _ in range(N_WARMUP_STEPS):
+        libsumo.simulationStep()
+        for veh in libsumo.simulation.getDepartedIDList():
+            libsumo.vehicle.subscribe(veh, LibsumoParallelConnection._VEHICLE_SUBSCRIPTION)
+
+    log_veh_count = []
+    log_per_vehicle = {n_egos: [] for n_egos in N_EGOS}
+    log_subscription = {n_egos: [] for n_egos in N_EGOS}
+    for _ in range(N_STEPS):
+        for n_egos in N_EGOS:
+            ego_ids = tuple(libsumo.vehicle.getIDList()[::40][:n_egos])
+            ego_pos = np.array([libsumo.vehicle.getPosition(ego_id) for ego_id in ego_ids])
+            subgraph = set()
+            for x, y in ego_pos:
+                for edge, _ in network.getNeighboringEdges(x, y, DISTANCE, includeJunctions=True):
+                    subgraph.add(edge.getID())
+
+            t1 = time.perf_counter()
+            selected_per_vehicle = out_of_range_per_vehicle(subgraph, ego_ids, ego_pos, DISTANCE * 1.5)
+            t2 = time.perf_counter()
+            selected_subscription = LibsumoParallelConnection._get_vehicles_out_of_range(
+                libsumo.vehicle.getAllSubscriptionResults(), subgraph, ego_ids, ego_pos, DISTANCE * 1.5)
+            t3 = time.perf_counter()
+            assert sorted(selected_per_vehicle) == sorted(selected_subscription)
+
+            log_per_vehicle[n_egos].append(t2 - t1)
+            log_subscription[n_egos].append(t3 - t2)
+        log_veh_count.append(libsumo.vehicle.getIDCount())
+
+        libsumo.simulationStep()
+        for veh in libsumo.simulation.getDepartedIDList():
+            libsumo.vehicle.subscribe(veh, LibsumoParallelConnection._VEHICLE_SUBSCRIPTION)
+    libsumo.close()
+
+    print(f"Removal scan over {N_STEPS} steps, {np.min(log_veh_count)}-{np.max(log_veh_count)} vehicles:")
+    for n_egos in N_EGOS:
+        for name, times in (('per-vehicle calls', log_per_vehicle[n_egos]),
+                            ('subscriptions', log_subscription[n_egos])):
+            print(f"  {n_egos:2d} EGOs, {name:>17}: mean = {np.mean(times) * 1e3:6.3f} ms, "
+                  f"p50 = {np.percentile(times, 50) * 1e3:6.3f} ms, p99 = {np.percentile(times, 99) * 1e3:6.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import sys, os
+import random
+import time
+import numpy as np
+from libsumo_parallel import *
+from simulate_town_cosim import micro_callback
+
+N_STEPS = 1000
+DISTANCE = 250
+
+
+def create_town_cosim(seed=0, callbacks=(micro_callback, None), connection_class=LibsumoParallelConnection,
+                      connection_kwargs=None):
+    """
+        Creates the town co-simulation and returns the connection, the network, the edge IDs and the micro and meso
+        commands to start it with.
+    """
+    random.seed(seed)
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sumo_cmd = ["sumo", "-c", script_dir + "/town_scenario/town.sumocfg", "--start", "--seed", str(seed)]
+    network_path = script_dir + "/town_scenario/town.net.xml"
+    parallel_conn = connection_class(*callbacks, **(connection_kwargs or {}))
+    network = parallel_conn.parse_network(network_path)
+    edges = []
+    for e in network.getEdges():
+        edges.append(e.getID())
+    micro_cmd, meso_cmd = parallel_conn.create_meso(sumo_cmd)
+    return parallel_conn, network, edges, micro_cmd, meso_cmd
+
+
+def town_steps(parallel_conn, network, edges, n_steps, ego_id='ego'):
+    """
+        Runs the steps of the town co-simulation with a single EGO and yields the step time and the micro callback
+        returns of each step.
+    """
+    for i in range(n_steps):
+        t1_step = time.perf_counter()
+        parallel_conn.set_callback_arguments((ego_id, i == 0, edges), True)
+        parallel_conn.simulation_step(network)
+        step_time = time.perf_counter() - t1_step
+        yield step_time, parallel_conn.get_callback_returns(True)
+
+
+def run_town_cosim(n_steps, distance=DISTANCE, seed=0, connection_kwargs=None, start_kwargs=None):
+    """
+        Runs the town co-simulation with a single EGO and returns the step times and the micro vehicle counts.
+    """
+    parallel_conn, network, edges, micro_cmd, meso_cmd = create_town_cosim(seed, connection_kwargs=connection_kwargs)
+    parallel_conn.start(micro_cmd, meso_cmd, 'ego', distance, **(start_kwargs or {}))
+
+    log_veh_count = []
+    log_step_time = []
+    log_churn = []
+    for step_time, (veh_count, ego_speed, changed_lane, headway) in town_steps(parallel_conn, network, edges, n_steps):
+        log_step_time.append(step_time)
+        log_veh_count.append(veh_count)
+        statistics = parallel_conn.get_subgraph_statistics()
+        log_churn.append(statistics['added'] + statistics['removed'])
+
+    parallel_conn.close()
+    return np.array(log_step_time), np.array(log_veh_count), np.array(log_churn)
+
+
+def print_summary(name, step_times, veh_counts, churn):
+    print(f"  {name:>22}: step time mean = {np.mean(step_times) * 1e3:6.2f} ms, "
+          f"p50 = {np.percentile(step_times, 50) * 1e3:6.2f} ms, p99 = {np.percentile(step_times, 99) * 1e3:6.2f} ms, "
+          f"micro vehicles mean = {np.mean(veh_counts):6.1f}, max = {np.max(veh_counts)}, "
+          f"edges added + removed = {np.sum(churn)}")
+
+
+def main():
+    print(f"Town co-simulation, {N_STEPS} steps, distance = {DISTANCE} m:")
+    for mode in ('circle', 'road'):
+        results = run_town_cosim(N_STEPS, start_kwargs={'subgraph_mode': mode})
+        print_summary(mode, *results)
+        hysteresis = {'subgraph_mode': mode, 'exit_distance': 1.2 * DISTANCE, 'min_residence_steps': 10,
+                      'update_threshold': 5.0}
+        results = run_town_cosim(N_STEPS, start_kwargs=hysteresis)
+        print_summary(mode + ' with hysteresis', *results)
+
+
+if __name__ == "__main__":
+    main()
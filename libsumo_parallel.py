@@ -1,560 +1,3598 @@
-import random
-import sys
-import os
-from copy import deepcopy
-import math
-import multiprocessing as mp
-import libsumo
-from sumolib.net import readNet
-
-
-class LibsumoParallelConnection:
-    """
-        An object to that handles a microscopic and a mesoscopic SUMO connection simultaneously.
-
-        Args:
-            callback_micro (function): function that is executed periodically during the simulation accessing the
-                                       states of the microsimulation.
-            callback_meso (function): function that is executed periodically during the simulation accessing the states
-                                      of the meso simulation.
-    """
-
-    def __init__(self, callback_micro, callback_meso):
-
-        if 'SUMO_HOME' in os.environ:
-            tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-            sys.path.append(tools)
-        else:
-            sys.exit("Please declare environment variable 'SUMO_HOME'")
-
-        self.multi_ego = False
-
-        self._events = dict()
-        self._events['start_micro'] = mp.Event()
-        self._events['start_micro_DONE'] = mp.Event()
-        self._events['step_micro'] = mp.Event()
-        self._events['step_micro_DONE'] = mp.Event()
-        self._events['set_callback_micro_args'] = mp.Event()
-        self._events['set_callback_micro_args_DONE'] = mp.Event()
-        self._events['get_callback_micro_resturn'] = mp.Event()
-        self._events['get_callback_micro_resturn_DONE'] = mp.Event()
-
-        self._events['start_meso'] = mp.Event()
-        self._events['start_meso_DONE'] = mp.Event()
-        self._events['step_meso'] = mp.Event()
-        self._events['step_meso_DONE'] = mp.Event()
-        self._events['set_callback_meso_args'] = mp.Event()
-        self._events['set_callback_meso_args_DONE'] = mp.Event()
-        self._events['get_callback_meso_resturn'] = mp.Event()
-        self._events['get_callback_meso_resturn_DONE'] = mp.Event()
-        self._events['step_meso_first_part_DONE'] = mp.Event()
-
-        self._events['stop'] = mp.Event()
-
-        manager = mp.Manager()
-        self._set_values = manager.dict()
-        self._set_values['start_micro_cmd'] = manager.list()
-        self._set_values['start_meso_cmd'] = manager.list()
-        self._set_values['callback_micro_arguments'] = ()
-        self._set_values['callback_meso_arguments'] = ()
-
-        self._set_values['ego_id'] = ''
-        self._set_values['ego_pos'] = (0.0, 0.0)
-        self._set_values['multi_ego_id'] = ()
-        self._set_values['multi_ego_pos'] = ()
-        self._set_values['distance'] = 0.0
-        self._set_values['subgraph'] = ()
-        self._set_values['inflow'] = ()
-        self._set_values['new_links'] = ()
-        self._set_values['prev_subgraph'] = ()
-        self._set_values['prev_inflow_ids'] = ()
-
-        self._set_values['meso_routes'] = ()
-        self._set_values['meso_vehs'] = ()
-
-        self._set_values['callback_micro_return'] = ()
-        self._set_values['callback_meso_return'] = ()
-
-        self._sumo_micro = mp.Process(target=self._control_sumo_micro_instance, args=(callback_micro,))
-        self._sumo_meso = mp.Process(target=self._control_sumo_meso_instance, args=(callback_meso,))
-
-    def set_callback_arguments(self, arguments, micro):
-        """
-            Passes the arguments of the optianal callback function as a tuple. It writes the data to a shared memory
-            where the other process can access it.
-
-            Args:
-                micro (bool): if set, the arguments in the microsimulator's process is set. If false, the mesoscopic
-                              simulator's callback arguments are set.
-                arguments (tuple): arguments of the callback function
-        """
-        if micro:
-            self._set_values['callback_micro_arguments'] = arguments
-        else:
-            self._set_values['callback_meso_arguments'] = arguments
-
-    def get_callback_returns(self, micro):
-        """
-            Gets the return values of the callback function as a tuple. It reads the shared memory.
-
-            Args:
-                micro (bool): if set, the return values in the microsimulator's process returned. If false, the
-                              mesoscopic simulator's callback return values are returned.
-            Returns:
-                values (tuple): return value of the callback function
-        """
-        if micro:
-            return self._set_values['callback_micro_return']
-        else:
-            return self._set_values['callback_meso_return']
-
-    def start(self, cmd_micro, cmd_meso, ego_id, distance):
-        """
-            Starts both processes and the SUMO instances as well.
-
-            Args:
-                cmd_micro (list): SUMO command to start the microscopic simulation
-                cmd_meso (list): SUMO command to start the mesoscopic simulation
-                ego_id (string or list): name(s) of the ego vehicle(s)
-                distance (float): road distance in which microsimulation is used wrt the EGO coordinates. Only edges
-                                  within the range is simulated with car following dynamics
-        """
-
-        if type(ego_id) is str:
-            self.multi_ego = False
-            self._set_values['ego_id'] = ego_id
-        elif type(ego_id) is list:
-            self.multi_ego = True
-            self._set_values['multi_ego_id'] = tuple(ego_id)
-        else:
-            raise TypeError("ego_id must be a string or a list of strings")
-        self._set_values['distance'] = distance
-
-        self._sumo_meso.start()
-        self._set_values['start_meso_cmd'][:] = cmd_meso
-        self._events['start_meso'].set()
-        self._events['start_meso_DONE'].wait()
-        self._events['start_meso_DONE'].clear()
-
-        self._sumo_meso = None  # remove from pickle
-
-        self._sumo_micro.start()
-        self._set_values['start_micro_cmd'][:] = cmd_micro
-        self._events['start_micro'].set()
-        self._events['start_micro_DONE'].wait()
-        self._events['start_micro_DONE'].clear()
-
-        self._sumo_micro = None  # remove from pickle
-
-    def close(self):
-        """
-            Stops sumo and kills the process
-        """
-        self._events['stop'].set()
-        try:
-            self._sumo_micro.join()
-        except AttributeError:
-            pass
-        try:
-            self._sumo_meso.join()
-        except AttributeError:
-            pass
-
-    def simulation_step(self, network):
-        """
-            Steps the SUMO instance within the process.
-            
-            Args:
-                network (object): network object
-        """
-        self._get_microsimulation_subgraph_simplified(network)
-        self._events['step_meso'].set()
-        self._events['step_micro'].set()
-        self._events['step_meso_DONE'].wait()
-        self._events['step_meso_DONE'].clear()
-        self._events['step_micro_DONE'].wait()
-        self._events['step_micro_DONE'].clear()
-
-    def create_meso(self, sumocmd, meso_gui=False, meso_limited_jc=True, meso_overtaking=True):
-        """
-            Takes the SUMO simulation configuration command and clones the SUMO config files (.sumocfg) with the mesosim
-            flag enabled (<simulation>_meso.sumocfg) and with the routes removed (<simulation>_noRoutes.sumocfg).
-            Returns  SUMO start commands for the two simulations.
-
-            Args:
-                sumocmd (list: string): Sumo start configuration, e.g., ["sumo-gui", "-c", "test.sumocfg", "--start"]
-                meso_gui (bool): Start the meso simulation with a GUI. Optional. Default: False.
-                meso_limited_jc (bool): Limited junction control. See SUMO documentation for further description.
-                                        Optional. Default: True.
-                meso_overtaking (bool): Mesoscopic overtaking. See SUMO documentation for further description. Optional.
-                                        Default: True.
-            Returns:
-                micro_cmd (list: string): Sumo command to start the microscopic simulation
-                meso_cmd (list: string): Sumo command to start the mesoscopic simulation
-        """
-        config_name = ''
-        index = 0
-        for i, arg in enumerate(sumocmd):
-            if '.sumocfg' in arg:
-                config_name = arg
-                index = i
-        if not config_name:
-            sys.exit("Please provide a .sumocfg file in the arguments")
-
-        meso_config_name = self._create_meso_net(config_name, dump_enabled=False, meso_limited_jc=meso_limited_jc,
-                                                 meso_overtaking=meso_overtaking)
-        micro_config_name = self._create_noflow_net(config_name)
-
-        meso_cmd = deepcopy(sumocmd)
-        if meso_gui is False:
-            meso_cmd[0] = "sumo"
-        else:
-            meso_cmd[0] = "sumo-gui"
-        meso_cmd[index] = meso_config_name
-
-        micro_cmd = deepcopy(sumocmd)
-        micro_cmd[index] = micro_config_name
-
-        return micro_cmd, meso_cmd
-
-    @staticmethod
-    def _create_meso_net(config_name, dump_enabled=False, meso_limited_jc=True, meso_overtaking=True):
-        """
-            Creates a mesoscopic simulation from the given sumo file.
-
-            Args:
-                config_name (string): Sumo confilg file
-                meso_limited_jc (bool): Limited junction control. See SUMO documentation for further description.
-                                        Optional. Default: True.
-                meso_overtaking (bool): Mesoscopic overtaking. See SUMO documentation for further description.
-                                        Optional. Default: True.
-            Returns:
-                meso_config_name (string): Name of the sumocfg file with meso simulation.
-        """
-        with open(config_name, 'r') as f:
-            contents = f.read()
-        contents_lines = contents.splitlines()
-        for line in contents_lines:
-            line = line.replace(" ", "")
-            if "mesosimvalue=\"true\"" in line:
-                sys.exit("Mesoscopic simulation already enabled")
-
-        meso_config_name = "{}{}{}".format(config_name[:-8], "_meso", config_name[-8:])
-        st_outputs = False
-        with open(meso_config_name, 'w') as f:
-            for line in contents_lines:
-                if "</input>" in line:
-                    f.write("\n\t<mesoscopic>\n")
-                    f.write("\t\t<mesosim value = \"true\"/>\n")
-                    if meso_limited_jc:
-                        f.write("\t\t<meso-junction-control.limited value = \"true\"/>\n")
-                    else:
-                        f.write("\t\t<meso-junction-control.limited value = \"false\"/>\n")
-                    if meso_overtaking:
-                        f.write("\t\t<meso-overtaking value = \"true\"/>\n")
-                    else:
-                        f.write("\t\t<meso-overtaking value = \"false\"/>\n")
-                    f.write("\t</mesoscopic>\n\n")
-                if dump_enabled:
-                    if "</output>" in line:
-                        f.write("\t\t<netstate-dump value = \"meso_vehicle_dump.xml\"/>\n")
-                        st_outputs = True
-
-                    if "</configuration>" in line and st_outputs is False:
-                        f.write("\t<output>\n")
-                        f.write("\t\t<netstate-dump value = \"meso_vehicle_dump.xml\"/>\n")
-                        f.write("\t</output>\n")
-                f.write(line + "\n")
-
-        return meso_config_name
-
-    @staticmethod
-    def _create_noflow_net(config_name):
-        """
-            Creates a microscpoic simulation without route files
-
-            Args:
-                config_name (string): Sumo confilg file
-            Returns:
-                micro_config_name (string): Name of the sumocfg file with meso simulation.
-        """
-        with open(config_name, 'r') as f:
-            contents = f.read()
-        contents_lines = contents.splitlines()
-
-        micro_config_name = "{}{}{}".format(config_name[:-8], "_noRoutes", config_name[-8:])
-        with open(micro_config_name, 'w') as f:
-            for line in contents_lines:
-                if "route-files" in line:
-                    continue
-                f.write(line + "\n")
-
-        return micro_config_name
-
-    @staticmethod
-    def parse_network(network_file):
-        """
-            Parses the .net file to get a list of edge start/end locations in the scenario.
-
-            Args:
-                network_file (string): the network file
-            Returns:
-                network (object): network object
-        """
-        return readNet(network_file)
-
-    def _get_microsimulation_subgraph_simplified(self, network):
-        """
-            Gets subgraph where microsimulation takes place - uses a circle of given radius instead of graph search.
-
-            Args:
-                network (object): network object
-            Returns:
-                subgraph (list: string): List of microsimulaed edges
-        """
-
-        # Init
-        distance = self._set_values['distance']
-        subgraph = []
-
-        if self.multi_ego:
-            for pos in self._set_values['multi_ego_pos']:
-                x, y = pos
-                edges = network.getNeighboringEdges(x, y, distance, includeJunctions=True)
-                for edge in edges:
-                    subgraph.append(edge[0].getID())
-            subgraph = list(set(subgraph))
-        else:
-            x, y = self._set_values['ego_pos']
-            edges = network.getNeighboringEdges(x, y, distance, includeJunctions=True)
-            for edge in edges:
-                subgraph.append(edge[0].getID())
-
-        self._set_values['subgraph_prev'] = self._set_values['subgraph']
-        self._set_values['subgraph'] = subgraph
-        self._set_values['inflow'] = self._get_inflow_edges(network)
-        self._set_values['new_links'] = list(set(subgraph) - set(self._set_values['subgraph_prev']))
-
-    def _get_inflow_edges(self, network):
-        """
-            Get inflow edges (which have no predecessor in the subgraph)
-            
-            Args:
-                network (object): network object
-            Returns:
-                inflow_edges (list: string): List of inflow edges of the subgraph
-        """
-        subgraph = self._set_values['subgraph']
-        inflow_edges = []
-        for edge in subgraph:
-            inflow = True
-            edge_obj = network.getEdge(edge)
-            from_node = edge_obj.getFromNode()
-            to_node = edge_obj.getToNode()
-            upstream_edges = from_node.getIncoming()
-            for upstream_edge in upstream_edges:
-                upstream_id = upstream_edge.getID()
-                upstream_from_node = upstream_edge.getFromNode()
-                if upstream_id in subgraph and upstream_from_node != to_node:
-                    inflow = False
-            if inflow:
-                inflow_edges.append(edge)
-        return inflow_edges
-
-    def _control_sumo_meso_instance(self, callback):
-        while True:
-            # Interrupts
-            if self._events['start_meso'].is_set():
-                libsumo.start(self._set_values['start_meso_cmd'])
-                self._events['start_meso'].clear()
-                self._events['start_meso_DONE'].set()
-            if self._events['stop'].is_set():
-                libsumo.close()
-                break
-            
-            if self._events['step_meso'].is_set():
-                inflows = list(self._set_values['inflow'])
-                renders = list(self._set_values['new_links'])
-                micro_veh_ids = self._set_values['prev_inflow_ids']
-
-                # To be rendered:
-                route_to_add = []
-                veh_to_add = []
-                for edge in renders:
-                    meso_vehicles = libsumo.edge.getLastStepVehicleIDs(edge)
-                    if not meso_vehicles:
-                        pass
-                    else:
-                        for meso_veh in meso_vehicles:
-                            meso_route = libsumo.vehicle.getRouteID(meso_veh)
-
-                            route_edges = libsumo.route.getEdges(meso_route)
-                            try:
-                                index = route_edges.index(edge)
-                            except ValueError:
-                                pass
-                            else:
-                                route_edges = route_edges[index:]
-                            route_to_add.append((meso_veh, route_edges))
-                            veh_to_add.append(meso_veh)
-                # Inflows
-                for edge in inflows:
-                    meso_vehicles = libsumo.edge.getLastStepVehicleIDs(edge)
-                    if not meso_vehicles:
-                        pass
-                    else:
-                        try:
-                            new_vehs = list(set(meso_vehicles) - set(micro_veh_ids[edge]))
-                        except KeyError:
-                            new_vehs = meso_vehicles
-                        for meso_veh in new_vehs:
-                            try:
-                                meso_route = libsumo.vehicle.getRouteID(meso_veh)
-
-                                route_edges = libsumo.route.getEdges(meso_route)
-                            except libsumo.TraCIException:
-                                continue
-                            try:
-                                index = route_edges.index(edge)
-                            except ValueError:
-                                pass
-                            else:
-                                route_edges = route_edges[index:]
-                            route_to_add.append((meso_veh, route_edges))
-                            veh_to_add.append(meso_veh)
-
-                self._set_values['meso_routes'] = route_to_add
-                self._set_values['meso_vehs'] = veh_to_add
-
-                # Data is passed to the micro process here. Now the two run in parallel
-                self._events['step_meso_first_part_DONE'].set()
-
-                # Callback function
-                if callback is not None:
-                    callback_args = self._set_values['callback_meso_arguments'] = ()
-                    callback_return = callback(*callback_args)
-                    self._set_values['callback_meso_return'] = callback_return
-
-                # Step the simulation
-                libsumo.simulationStep()
-                self._events['step_meso'].clear()
-                self._events['step_meso_DONE'].set()
-
-    def _control_sumo_micro_instance(self, callback):
-        while True:
-            # Interrupts
-            if self._events['start_micro'].is_set():
-                libsumo.start(self._set_values['start_micro_cmd'])
-                self._events['start_micro'].clear()
-                self._events['start_micro_DONE'].set()
-            if self._events['stop'].is_set():
-                libsumo.close()
-                break
-            if self._events['step_micro'].is_set():
-                self._events['step_meso_first_part_DONE'].wait()
-                self._events['step_meso_first_part_DONE'].clear()
-
-                inflows = list(self._set_values['inflow'])
-                subgraph = list(self._set_values['subgraph'])
-                distance = self._set_values['distance']
-                new_vehs = self._set_values['meso_vehs']
-                new_routes = self._set_values['meso_routes']
-
-                # Add vehicles
-                for route, veh in zip(new_routes, new_vehs):
-                    try:
-                        if len(route[1]) < 2:
-                            continue
-                        libsumo.route.add(route[0], route[1])
-                    except libsumo.TraCIException:
-                        pass
-                    try:
-                        libsumo.vehicle.add(veh, veh, depart='now', departLane='best',
-                                            departPos='free', departSpeed='max')
-                    except libsumo.TraCIException:
-                        r = random.randint(0, 1e7)
-                        try:
-                            libsumo.vehicle.add(veh + str(r), veh, depart='now', departLane='best',
-                                                departPos='free', departSpeed='max')
-                        except libsumo.TraCIException:
-                            sys.stdout.write(f"Could not insert {veh}\n", )
-                        # pass
-                # Clear links
-                micro_veh_ids = libsumo.vehicle.getIDList()
-                if self.multi_ego:
-                    ego_ids = self._set_values['multi_ego_id']
-                    ego_pos_tuples = self._set_values['multi_ego_pos']
-                else:
-                    ego_id = self._set_values['ego_id']
-                    x, y = self._set_values['ego_pos']
-
-                for veh in micro_veh_ids:
-                    if self.multi_ego:
-                        if veh in ego_ids:
-                            continue
-                        else:
-                            edge_id = libsumo.vehicle.getRoadID(veh)
-                            if edge_id in subgraph:
-                                continue
-                            else:
-                                try:
-                                    x2, y2 = libsumo.vehicle.getPosition(veh)
-                                    out_of_range = []
-                                    for pos in ego_pos_tuples:
-                                        x, y = pos
-                                        if math.sqrt((x2 - x) ** 2 + (y2 - y) ** 2) > distance * 1.5:
-                                            out_of_range.append(True)
-                                        else:
-                                            out_of_range.append(False)
-                                    if all(out_of_range):
-                                        libsumo.vehicle.remove(veh, reason=2)
-                                except libsumo.TraCIException:
-                                    pass  # vehicle was already removed from another link.
-                    else:
-                        if veh == ego_id:
-                            continue
-                        else:
-                            edge_id = libsumo.vehicle.getRoadID(veh)
-                            if edge_id in subgraph:
-                                continue
-                            else:
-                                try:
-                                    x2, y2 = libsumo.vehicle.getPosition(veh)
-                                    if math.sqrt((x2 - x) ** 2 + (y2 - y) ** 2) > distance * 1.5:
-                                        libsumo.vehicle.remove(veh, reason=2)
-                                except libsumo.TraCIException:
-                                    pass  # vehicle was already removed from another link.
-
-                # Callback function
-                if callback is not None:
-                    callback_args = self._set_values['callback_micro_arguments']
-                    callback_return = callback(*callback_args)
-                    self._set_values['callback_micro_return'] = callback_return
-
-                # Step the simulation
-                libsumo.simulationStep()
-
-                # Data from the microsimulator needed by the meso sim in the next step
-                # (to avoid loss of synchronization)
-                tmp_inflow_ids = dict()
-                for edge in inflows:
-                    tmp_inflow_ids[edge] = libsumo.edge.getLastStepVehicleIDs(edge)
-                self._set_values['prev_inflow_ids'] = tmp_inflow_ids
-
-                if self.multi_ego:
-                    tmp_ego_pos_list = []
-                    for ego_id in ego_ids:
-                        try:
-                            tmp_ego_pos_list.append(libsumo.vehicle.getPosition(ego_id))
-                        except libsumo.TraCIException:
-                            tmp_ego_pos_list.append((0, 0))
-                            sys.stdout.write("EGO is not in the simulation\n")
-                    self._set_values['multi_ego_pos'] = tmp_ego_pos_list
-                else:
-                    try:
-                        self._set_values['ego_pos'] = libsumo.vehicle.getPosition(self._set_values['ego_id'])
-                    except libsumo.TraCIException:
-                        sys.stdout.write("EGO is not in the simulation\n")
-
-                self._events['step_micro'].clear()
-                self._events['step_micro_DONE'].set()
\ No newline at end of file
+import sys
+import os
+import struct
+import pickle
+import json
+import traceback
+import functools
+import asyncio
+from copy import deepcopy
+import math
+import heapq
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import time
+from xml.etree import ElementTree
+import multiprocessing as mp
+import multiprocessing.connection
+from multiprocessing import shared_memory
+import numpy as np
+import libsumo
+from sumolib.net import readNet
+
+
+class _SharedRegion:
+    """
+        A single preallocated shared memory region with one writer. Payloads that do not fit into the region are
+        spilled into a separately allocated (and grow-only) shared memory block, whose name is published in the header.
+
+        Args:
+            capacity (int): size of the preallocated payload area in bytes
+    """
+
+    _HEADER = struct.Struct('qqq48s')  # payload size, total bytes written, spill capacity, spill name
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=self._HEADER.size + capacity)
+        self._HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, b'')
+        self._spill = None
+        self._spill_owner = False
+
+    def write(self, chunks):
+        """
+            Writes the concatenation of the byte chunks into the region.
+
+            Args:
+                chunks (list: bytes): payload parts
+        """
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+        if size <= self._capacity:
+            buf = self._shm.buf
+            pos = self._HEADER.size
+            spill_capacity = 0 if self._spill is None else self._spill.size
+            spill_name = b'' if self._spill is None else self._spill.name.encode()
+        else:
+            if self._spill is None or not self._spill_owner or self._spill.size < size:
+                self._release_spill()
+                self._spill = shared_memory.SharedMemory(create=True, size=max(size, 2 * self._capacity))
+                self._spill_owner = True
+            buf = self._spill.buf
+            pos = 0
+            spill_capacity = self._spill.size
+            spill_name = self._spill.name.encode()
+        for chunk in chunks:
+            buf[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        written = self.bytes_written() + size
+        self._HEADER.pack_into(self._shm.buf, 0, size, written, spill_capacity, spill_name)
+
+    def read(self):
+        """
+            Returns a view of the last written payload. The view is only valid until the next write.
+
+            Returns:
+                payload (memoryview): payload bytes
+        """
+        size, _, spill_capacity, spill_name = self._HEADER.unpack_from(self._shm.buf, 0)
+        if size <= self._capacity:
+            return self._shm.buf[self._HEADER.size:self._HEADER.size + size]
+        spill_name = spill_name.rstrip(b'\0').decode()
+        if self._spill is None or self._spill.name != spill_name:
+            self._release_spill()
+            self._spill = shared_memory.SharedMemory(name=spill_name)
+            self._spill_owner = False
+        return self._spill.buf[:size]
+
+    def bytes_written(self):
+        """
+            Returns the total number of payload bytes written into the region by any process.
+
+            Returns:
+                written (int): number of bytes
+        """
+        return struct.unpack_from('q', self._shm.buf, 8)[0]
+
+    def _release_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+            if self._spill_owner:
+                self._spill.unlink()
+            self._spill = None
+
+    def close(self, unlink=False):
+        self._release_spill()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class SharedStepChannel:
+    """
+        Step-exchange channel between the main process and the SUMO worker processes. Every value exchanged in a
+        simulation step has its own preallocated shared memory region, so reading or writing it is a memory copy
+        instead of a pickled round-trip to a manager process. Synchronization is left to the caller (the step events).
+
+        Region types:
+            ids: list of strings (edge or vehicle IDs), stored as NUL separated UTF-8 bytes
+            records: list of (string, list of strings) pairs, e.g., vehicle handoff records (vehicle ID, route edges)
+            ints: 1D int32 array, e.g., interned edge or vehicle IDs
+            int_records: list of (int, list of ints) pairs, e.g., interned route definitions (route, edges)
+            floats: 2D float64 array, e.g., ego positions
+            object: any picklable object, used as fallback for the user callback arguments and return values
+
+        Args:
+            regions (dict): region name -> region type
+            capacity (int): preallocated size of each region in bytes. Optional. Default: 64 kB.
+    """
+
+    def __init__(self, regions, capacity=65536):
+        self._regions = dict()
+        for name in regions:
+            self._regions[name] = _SharedRegion(capacity)
+
+    @staticmethod
+    def _pack_ids(ids):
+        # SUMO IDs cannot contain NUL characters, so a single join is enough
+        data = '\0'.join(ids).encode()
+        return [struct.pack('ii', len(ids), len(data)), data]
+
+    @staticmethod
+    def _unpack_ids(view, pos=0):
+        n, size = struct.unpack_from('ii', view, pos)
+        pos += 8
+        if n == 0:
+            return [], pos
+        return str(view[pos:pos + size], 'utf-8').split('\0'), pos + size
+
+    def write_ids(self, name, ids):
+        self._regions[name].write(self._pack_ids(ids))
+
+    def read_ids(self, name):
+        return self._unpack_ids(self._regions[name].read())[0]
+
+    def write_records(self, name, records):
+        keys = []
+        counts = np.zeros(len(records), dtype=np.int32)
+        values = []
+        for i, (key, items) in enumerate(records):
+            keys.append(key)
+            counts[i] = len(items)
+            values.extend(items)
+        self._regions[name].write(self._pack_ids(keys) + [counts.tobytes()] + self._pack_ids(values))
+
+    def read_records(self, name):
+        view = self._regions[name].read()
+        keys, pos = self._unpack_ids(view)
+        counts = np.frombuffer(view, dtype=np.int32, count=len(keys), offset=pos).tolist()
+        values, _ = self._unpack_ids(view, pos + 4 * len(keys))
+        records = []
+        start = 0
+        for key, count in zip(keys, counts):
+            records.append((key, values[start:start + count]))
+            start += count
+        return records
+
+    def write_ints(self, name, values):
+        values = np.ascontiguousarray(values, dtype=np.int32)
+        self._regions[name].write([struct.pack('i', len(values)), values.tobytes()])
+
+    def read_ints(self, name):
+        view = self._regions[name].read()
+        n, = struct.unpack_from('i', view, 0)
+        return np.frombuffer(view, dtype=np.int32, count=n, offset=4).copy()
+
+    def write_int_records(self, name, records):
+        keys = np.zeros(len(records), dtype=np.int32)
+        counts = np.zeros(len(records), dtype=np.int32)
+        values = []
+        for i, (key, items) in enumerate(records):
+            keys[i] = key
+            counts[i] = len(items)
+            values.extend(items)
+        values = np.array(values, dtype=np.int32)
+        self._regions[name].write([struct.pack('i', len(records)), keys.tobytes(), counts.tobytes(),
+                                   values.tobytes()])
+
+    def read_int_records(self, name):
+        view = self._regions[name].read()
+        n, = struct.unpack_from('i', view, 0)
+        keys = np.frombuffer(view, dtype=np.int32, count=n, offset=4).tolist()
+        counts = np.frombuffer(view, dtype=np.int32, count=n, offset=4 + 4 * n)
+        values = np.frombuffer(view, dtype=np.int32, count=int(counts.sum()), offset=4 + 8 * n).tolist()
+        records = []
+        start = 0
+        for key, count in zip(keys, counts.tolist()):
+            records.append((key, values[start:start + count]))
+            start += count
+        return records
+
+    def write_floats(self, name, values):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        self._regions[name].write([struct.pack('ii', *values.shape), values.tobytes()])
+
+    def read_floats(self, name):
+        view = self._regions[name].read()
+        rows, cols = struct.unpack_from('ii', view, 0)
+        return np.frombuffer(view, dtype=np.float64, count=rows * cols, offset=8).reshape(rows, cols).copy()
+
+    def write_object(self, name, obj):
+        self._regions[name].write([pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)])
+
+    def read_object(self, name):
+        return pickle.loads(self._regions[name].read())
+
+    def bytes_written(self):
+        """
+            Gets the total number of payload bytes written into each region by any of the processes.
+
+            Returns:
+                written (dict): region name -> number of bytes
+        """
+        return {name: region.bytes_written() for name, region in self._regions.items()}
+
+    def get_state(self):
+        """
+            Copies the last payload of every region.
+
+            Returns:
+                state (dict): region name -> payload bytes
+        """
+        return {name: bytes(region.read()) for name, region in self._regions.items()}
+
+    def set_state(self, state):
+        """
+            Writes the payloads copied by get_state into the regions.
+
+            Args:
+                state (dict): region name -> payload bytes
+        """
+        for name, payload in state.items():
+            self._regions[name].write([payload])
+
+    def close(self, unlink=False):
+        """
+            Detaches from the shared memory regions.
+
+            Args:
+                unlink (bool): if set, the regions are destroyed as well. Only the creating process should unlink.
+        """
+        for region in self._regions.values():
+            region.close(unlink)
+
+
+class IdTable:
+    """
+        Interning table of SUMO IDs: every ID gets the next integer when it is first added. Processes that add the same
+        IDs in the same order share the table, so they can exchange the integers instead of the strings.
+
+        Args:
+            ids (list: string): initial IDs. Optional.
+    """
+
+    def __init__(self, ids=()):
+        self.ids = []
+        self.index = dict()
+        for item in ids:
+            self.add(item)
+
+    def add(self, item):
+        """
+            Interns an ID.
+
+            Args:
+                item (string): the ID
+            Returns:
+                index (int): integer of the ID
+        """
+        index = self.index.get(item)
+        if index is None:
+            index = len(self.ids)
+            self.index[item] = index
+            self.ids.append(item)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class StepProfiler:
+    """
+        Records the durations of the phases of the co-simulation steps in a process. A record consists of the step
+        number, the phase and its start and end time on the monotonic clock (time.perf_counter_ns, which all processes
+        of the machine share). The records are written into a preallocated array used as ring buffer, so only the last
+        capacity records are kept. With zero capacity, the profiler is switched off and does not record anything.
+
+        Usage: t = profiler.clock(), then t = profiler.record('phase', t) at the end of each phase.
+
+        Args:
+            capacity (int): number of records kept. Optional. Default: 0.
+    """
+
+    def __init__(self, capacity=0):
+        self.capacity = capacity
+        self.step = 0
+        self._phases = IdTable()
+        self._records = np.zeros((capacity, 4), dtype=np.int64)  # step, phase, start, end
+        self._count = 0
+
+    def clock(self):
+        """
+            Returns:
+                time (int): current time in nanoseconds, 0 if the profiler is switched off
+        """
+        if not self.capacity:
+            return 0
+        return time.perf_counter_ns()
+
+    def record(self, phase, start):
+        """
+            Records a phase of the current step that ends now.
+
+            Args:
+                phase (string): name of the phase
+                start (int): start time of the phase in nanoseconds (see clock)
+            Returns:
+                end (int): end time of the phase in nanoseconds, which is the start of the next phase
+        """
+        if not self.capacity:
+            return 0
+        end = time.perf_counter_ns()
+        self._records[self._count % self.capacity] = (self.step, self._phases.add(phase), start, end)
+        self._count += 1
+        return end
+
+    def get_records(self):
+        """
+            Gets the kept records, the oldest first.
+
+            Returns:
+                records (numpy.ndarray: int): step number, phase index, start and end time in nanoseconds of each
+                                              record
+                phases (list: string): names of the phases by index
+        """
+        if self._count <= self.capacity:
+            records = self._records[:self._count]
+        else:
+            i = self._count % self.capacity
+            records = np.concatenate((self._records[i:], self._records[:i]))
+        return records.copy(), list(self._phases.ids)
+
+
+class VehicleStateFrame:
+    """
+        Columnar view of the vehicle states of a SUMO instance, filled from one batch of subscription results (the
+        vehicles have to be subscribed to VARIABLES). The arrays are preallocated and reused in every step, they only
+        grow when there are more vehicles than ever before. The attributes are views of the arrays, which are only valid
+        until the next update.
+
+        Attributes:
+            ids (numpy.ndarray: object): vehicle IDs
+            positions (numpy.ndarray: float): x and y position of each vehicle
+            speeds (numpy.ndarray: float): speeds in m/s
+            edges (numpy.ndarray: object): IDs of the edges of the vehicles (internal edges start with ':')
+            lanes (numpy.ndarray: int): lane indices of the vehicles
+
+        Args:
+            capacity (int): number of vehicles the arrays are allocated for initially. Optional. Default: 1024.
+    """
+
+    VARIABLES = (libsumo.constants.VAR_ROAD_ID, libsumo.constants.VAR_POSITION, libsumo.constants.VAR_SPEED,
+                 libsumo.constants.VAR_LANE_INDEX)
+
+    def __init__(self, capacity=1024):
+        self._allocate(capacity)
+        self._size = 0
+        self._rows = None
+        self._set_views()
+
+    def _allocate(self, capacity):
+        self._ids = np.empty(capacity, dtype=object)
+        self._positions = np.zeros((capacity, 2), dtype=np.float64)
+        self._speeds = np.zeros(capacity, dtype=np.float64)
+        self._edges = np.empty(capacity, dtype=object)
+        self._lanes = np.zeros(capacity, dtype=np.int32)
+
+    def _set_views(self):
+        n = self._size
+        self.ids = self._ids[:n]
+        self.positions = self._positions[:n]
+        self.speeds = self._speeds[:n]
+        self.edges = self._edges[:n]
+        self.lanes = self._lanes[:n]
+
+    def update(self, results, removed=()):
+        """
+            Fills the frame with the subscription results of a step.
+
+            Args:
+                results (dict): vehicle ID -> subscribed variable -> value, as returned by
+                                libsumo.vehicle.getAllSubscriptionResults after the step
+                removed (set: string): IDs of the vehicles removed since the step, which are left out. Optional.
+        """
+        if removed:
+            results = {veh: values for veh, values in results.items() if veh not in removed}
+        n = len(results)
+        if n > len(self._speeds):
+            self._allocate(max(n, 2 * len(self._speeds)))
+        if n:
+            road_id, position, speed, lane_index = self.VARIABLES
+            values = results.values()
+            self._ids[:n] = list(results)
+            self._positions[:n] = [value[position] for value in values]
+            self._speeds[:n] = [value[speed] for value in values]
+            self._edges[:n] = [value[road_id] for value in values]
+            self._lanes[:n] = [value[lane_index] for value in values]
+        self._size = n
+        self._rows = None
+        self._set_views()
+
+    def get_row(self, veh_id):
+        """
+            Gets the row of a vehicle in the arrays. The lookup table is built at the first call after an update.
+
+            Args:
+                veh_id (string): ID of the vehicle
+            Returns:
+                row (int): row of the vehicle, None if it is not in the frame
+        """
+        if self._rows is None:
+            self._rows = {veh: i for i, veh in enumerate(self.ids.tolist())}
+        return self._rows.get(veh_id)
+
+    def __len__(self):
+        return self._size
+
+
+class CallbackFuture(Future):
+    """
+        Future of the return value of an observe callback (see LibsumoParallelConnection). It is resolved when the
+        worker reports the return value with one of the next steps. If the result is requested before, it is fetched
+        from the worker, which waits for the callback to finish.
+
+        Args:
+            collect (function): fetches the pending return values of the worker and resolves their futures
+    """
+
+    def __init__(self, collect):
+        super().__init__()
+        self._collect = collect
+
+    def result(self, timeout=None):
+        if not self.done():
+            self._collect()
+        return super().result(timeout)
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self._collect()
+        return super().exception(timeout)
+
+
+def _blocking(phases):
+    """
+        Turns a generator method of LibsumoParallelConnection into a blocking method. The generator yields the name of
+        each worker whose acknowledgements it needs and receives their values (see _run_blocking), so that
+        AsyncLibsumoParallelConnection can drive the same generator, kept as __wrapped__, without blocking.
+    """
+    @functools.wraps(phases)
+    def method(self, *args, **kwargs):
+        return self._run_blocking(phases(self, *args, **kwargs))
+    return method
+
+
+def _peak_rss():
+    """
+        Gets the peak resident set size of the current process.
+
+        Returns:
+            rss (int): peak RSS in bytes, None if it is not available on the platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class NetworkEdge:
+    """
+        Edge of a NetworkIndex. Provides the part of the sumolib edge interface that is used with the co-simulation.
+
+        Args:
+            network (object): NetworkIndex of the edge
+            index (int): index of the edge in the NetworkIndex
+    """
+
+    def __init__(self, network, index):
+        self._network = network
+        self._index = index
+
+    def getID(self):
+        return self._network.ids[self._index]
+
+    def getLength(self):
+        return float(self._network.lengths[self._index])
+
+    def getShape(self, includeJunctions=False):
+        return self._network.get_shape(self._index, includeJunctions)
+
+    def getBoundingBox(self, includeJunctions=True):
+        boxes = self._network.junction_bounding_boxes if includeJunctions else self._network.bounding_boxes
+        return tuple(boxes[self._index].tolist())
+
+
+class NetworkIndex:
+    """
+        Compact index of the edge geometry and connectivity of a SUMO network in NumPy arrays, which replaces the
+        sumolib network object in the co-simulation. Edges are sorted by ID, like in the EdgeGraph. Successors,
+        predecessors and shapes are stored in compressed sparse row form, e.g., the shape of edge i is
+        shape_points[shape_ptr[i]:shape_ptr[i + 1]] (junction_shape_* is the shape including the junction positions).
+
+        The index is built from the sumolib network once and then it is cached next to the network file, keyed by the
+        hash of the file contents, so later runs do not parse the XML.
+
+        Args:
+            arrays (dict): array name -> numpy.ndarray, for every name in _ARRAYS
+    """
+
+    _VERSION = 1
+    _ARRAYS = ('ids', 'lengths', 'from_nodes', 'to_nodes', 'successors_ptr', 'successors_idx', 'predecessors_ptr',
+               'predecessors_idx', 'shape_ptr', 'shape_points', 'junction_shape_ptr', 'junction_shape_points',
+               'bounding_boxes', 'junction_bounding_boxes')
+
+    def __init__(self, arrays):
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        self.ids = arrays['ids'].tolist()
+        self.index = {edge_id: i for i, edge_id in enumerate(self.ids)}
+        self.load_statistics = dict()
+        self._edges = [NetworkEdge(self, i) for i in range(len(self.ids))]
+        # Shape segments (start, end, edge) for the distance queries, without and with the junction positions
+        self._segments = (self._get_segments(self.shape_ptr, self.shape_points),
+                          self._get_segments(self.junction_shape_ptr, self.junction_shape_points))
+
+    @staticmethod
+    def _get_segments(ptr, points):
+        edges = np.repeat(np.arange(len(ptr) - 1, dtype=np.int32), np.diff(ptr))
+        # A segment connects two consecutive points of the same edge
+        valid = edges[:-1] == edges[1:]
+        return points[:-1][valid], points[1:][valid], edges[:-1][valid]
+
+    @classmethod
+    def from_sumolib(cls, network):
+        """
+            Builds the index of a sumolib network.
+
+            Args:
+                network (object): sumolib network object
+            Returns:
+                network_index (object): NetworkIndex of the network
+        """
+        edges = sorted(network.getEdges(), key=lambda edge: edge.getID())
+        index = {edge.getID(): i for i, edge in enumerate(edges)}
+        nodes = dict()
+        arrays = {'ids': np.array([edge.getID() for edge in edges], dtype=str),
+                  'lengths': np.array([edge.getLength() for edge in edges], dtype=np.float64),
+                  'from_nodes': np.array([nodes.setdefault(edge.getFromNode().getID(), len(nodes)) for edge in edges],
+                                         dtype=np.int32),
+                  'to_nodes': np.array([nodes.setdefault(edge.getToNode().getID(), len(nodes)) for edge in edges],
+                                       dtype=np.int32)}
+        successors = [[index[e.getID()] for e in edge.getOutgoing() if e.getID() in index] for edge in edges]
+        predecessors = [[index[e.getID()] for e in edge.getIncoming() if e.getID() in index] for edge in edges]
+        arrays['successors_ptr'], arrays['successors_idx'], _ = EdgeGraph._to_csr(successors)
+        arrays['predecessors_ptr'], arrays['predecessors_idx'], _ = EdgeGraph._to_csr(predecessors)
+        for prefix, include_junctions in (('', False), ('junction_', True)):
+            shapes = [np.array(edge.getShape(include_junctions), dtype=np.float64)[:, :2] for edge in edges]
+            ptr = np.zeros(len(edges) + 1, dtype=np.int64)
+            np.cumsum([len(shape) for shape in shapes], out=ptr[1:])
+            arrays[prefix + 'shape_ptr'] = ptr
+            arrays[prefix + 'shape_points'] = np.concatenate(shapes) if shapes else np.zeros((0, 2))
+            arrays[prefix + 'bounding_boxes'] = np.array([(*shape.min(axis=0), *shape.max(axis=0))
+                                                          for shape in shapes], dtype=np.float64).reshape(-1, 4)
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, network_file, cache=True):
+        """
+            Loads the index of a network from the cache file next to the network file. If there is no cache file for
+            the current contents of the network file, the network is parsed with sumolib and the cache file is written.
+
+            Args:
+                network_file (string): the network file
+                cache (bool): if not set, the network is always parsed and no cache file is written. Optional.
+                              Default: True.
+            Returns:
+                network_index (object): NetworkIndex of the network, with the load time ('load_time'), whether it was
+                                        loaded from the cache ('cached') and the peak RSS of the process in bytes
+                                        ('peak_rss') in load_statistics
+        """
+        t_start = time.perf_counter()
+        digest = hashlib.sha256(f"NetworkIndex{cls._VERSION}".encode())
+        with open(network_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        cache_file = "{}.{}.npz".format(os.path.splitext(network_file)[0], digest.hexdigest()[:16])
+
+        cached = cache and os.path.exists(cache_file)
+        if cached:
+            with np.load(cache_file, allow_pickle=False) as data:
+                network = cls({name: data[name] for name in cls._ARRAYS})
+        else:
+            network = cls.from_sumolib(readNet(network_file))
+            if cache:
+                try:
+                    network.save(cache_file)
+                except OSError as e:
+                    sys.stdout.write(f"Could not write the network index cache {cache_file}: {e}\n")
+        network.load_statistics = {'load_time': time.perf_counter() - t_start, 'cached': cached,
+                                   'peak_rss': _peak_rss()}
+        return network
+
+    def save(self, path):
+        """
+            Writes the index arrays into an .npz file. The file is written under a temporary name and renamed, so
+            concurrent runs never read a partially written file.
+
+            Args:
+                path (string): path of the .npz file
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        arrays = {name: getattr(self, name) for name in self._ARRAYS}
+        arrays['ids'] = np.array(self.ids, dtype=str)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def get_shape(self, i, include_junctions=False):
+        """
+            Gets the shape of an edge.
+
+            Args:
+                i (int): index of the edge
+                include_junctions (bool): if set, the shape is extended to the junction positions. Optional.
+                                          Default: False.
+            Returns:
+                shape (list: tuple): (x, y) points of the shape
+        """
+        if include_junctions:
+            ptr, points = self.junction_shape_ptr, self.junction_shape_points
+        else:
+            ptr, points = self.shape_ptr, self.shape_points
+        return [tuple(point) for point in points[ptr[i]:ptr[i + 1]].tolist()]
+
+    def neighbouring_edges(self, x, y, r, include_junctions=True):
+        """
+            Gets the edges whose shape is closer to a point than the given distance. Only the segments of the edges
+            whose bounding box is within the distance are checked.
+
+            Args:
+                x (float): x coordinate of the point
+                y (float): y coordinate of the point
+                r (float): distance in meters
+                include_junctions (bool): if set, the shapes extended to the junction positions are used. Optional.
+                                          Default: True.
+            Returns:
+                indices (numpy.ndarray: int): indices of the edges
+                distances (numpy.ndarray: float): distance of the edges from the point
+        """
+        boxes = self.junction_bounding_boxes if include_junctions else self.bounding_boxes
+        near = (boxes[:, 0] <= x + r) & (boxes[:, 2] >= x - r) & (boxes[:, 1] <= y + r) & (boxes[:, 3] >= y - r)
+        start, end, edges = self._segments[include_junctions]
+        selected = near[edges]
+        if not selected.any():
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        start, end, edges = start[selected], end[selected], edges[selected]
+
+        # Distance from the closest point of each segment
+        direction = end - start
+        offset = np.array([x, y]) - start
+        length2 = np.einsum('ij,ij->i', direction, direction)
+        t = np.clip(np.einsum('ij,ij->i', offset, direction) / np.where(length2 > 0, length2, 1), 0, 1)
+        offset -= t[:, np.newaxis] * direction
+        segment_distances = np.hypot(offset[:, 0], offset[:, 1])
+
+        # Segments are ordered by edge
+        first = np.flatnonzero(np.r_[True, edges[1:] != edges[:-1]])
+        distances = np.minimum.reduceat(segment_distances, first)
+        within = distances < r
+        return edges[first][within], distances[within]
+
+    def getNeighboringEdges(self, x, y, r=0.1, includeJunctions=True):
+        indices, distances = self.neighbouring_edges(x, y, r, includeJunctions)
+        return [(self._edges[i], d) for i, d in zip(indices.tolist(), distances.tolist())]
+
+    def getEdge(self, edge_id):
+        return self._edges[self.index[edge_id]]
+
+    def getEdges(self):
+        return list(self._edges)
+
+
+class EdgeGraph:
+    """
+        Compact, integer indexed road graph of a network. Edge i has the ID ids[i], where the edges are sorted by ID, so
+        the indices match the NetworkIndex and the edge table of the SUMO processes. Successors and predecessors are
+        given by the lane connections of the network. Upstream and downstream edges are given by the
+        nodes (edges entering the from-node and leaving the to-node, except U-turns) in compressed sparse row form:
+        the upstream edges of edge i are upstream_idx[upstream_ptr[i]:upstream_ptr[i + 1]].
+
+        Args:
+            network (object): NetworkIndex of the network
+    """
+
+    def __init__(self, network):
+        self.ids = network.ids
+        self.index = network.index
+        self.lengths = network.lengths
+        self.successors = np.split(network.successors_idx, network.successors_ptr[1:-1])
+        self.predecessors = np.split(network.predecessors_idx, network.predecessors_ptr[1:-1])
+        self.from_nodes = network.from_nodes
+        self.to_nodes = network.to_nodes
+
+        n_edges = len(self.ids)
+        n_nodes = int(max(self.from_nodes.max(initial=-1), self.to_nodes.max(initial=-1))) + 1
+        from_nodes = self.from_nodes.tolist()
+        to_nodes = self.to_nodes.tolist()
+        incoming = [[] for _ in range(n_nodes)]
+        outgoing = [[] for _ in range(n_nodes)]
+        for i in range(n_edges):
+            incoming[to_nodes[i]].append(i)
+            outgoing[from_nodes[i]].append(i)
+        upstream = []
+        downstream = []
+        for i in range(n_edges):
+            upstream.append([j for j in incoming[from_nodes[i]] if from_nodes[j] != to_nodes[i]])
+            downstream.append([j for j in outgoing[to_nodes[i]] if to_nodes[j] != from_nodes[i]])
+        self.upstream_ptr, self.upstream_idx, self.upstream_rows = self._to_csr(upstream)
+        self.downstream_ptr, self.downstream_idx, self.downstream_rows = self._to_csr(downstream)
+
+    @staticmethod
+    def _to_csr(lists):
+        """
+            Converts adjacency lists to compressed sparse row arrays.
+
+            Args:
+                lists (list: list: int): neighbours of each edge
+            Returns:
+                ptr (numpy.ndarray: int): start of the neighbours of each edge in idx
+                idx (numpy.ndarray: int): concatenated neighbours
+                rows (numpy.ndarray: int): edge of each entry in idx
+        """
+        lengths = np.array([len(neighbours) for neighbours in lists], dtype=np.int32)
+        ptr = np.zeros(len(lists) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=ptr[1:])
+        idx = np.array([j for neighbours in lists for j in neighbours], dtype=np.int32)
+        rows = np.repeat(np.arange(len(lists), dtype=np.int32), lengths)
+        return ptr, idx, rows
+
+
+class SubgraphBoundary:
+    """
+        Inflow and outflow edges of the microsimulated subgraph, maintained incrementally as the subgraph changes. An
+        edge of the subgraph is an inflow edge if none of its upstream edges is in the subgraph, and an outflow edge if
+        none of its downstream edges is.
+
+        Args:
+            graph (object): EdgeGraph of the network
+            full_update_ratio (float): if more edges changed than this ratio of the subgraph size, the boundary is
+                                       recomputed with array operations instead of edge by edge. Optional.
+                                       Default: 0.5.
+    """
+
+    def __init__(self, graph, full_update_ratio=0.5):
+        self.graph = graph
+        self.full_update_ratio = full_update_ratio
+        self.members = np.zeros(len(graph.ids), dtype=bool)
+        self.inflow = set()
+        self.outflow = set()
+        # Number of upstream/downstream edges of each edge that are in the subgraph
+        self._upstream_count = np.zeros(len(graph.ids), dtype=np.int32)
+        self._downstream_count = np.zeros(len(graph.ids), dtype=np.int32)
+
+    def update(self, indices):
+        """
+            Updates the boundary to a new subgraph.
+
+            Args:
+                indices (numpy.ndarray: int): indices of the subgraph edges in the EdgeGraph
+            Returns:
+                added (numpy.ndarray: int): indices of the edges that entered the subgraph
+                removed (numpy.ndarray: int): indices of the edges that left the subgraph
+        """
+        graph = self.graph
+        members = np.zeros(len(graph.ids), dtype=bool)
+        members[indices] = True
+        added = np.flatnonzero(members & ~self.members)
+        removed = np.flatnonzero(self.members & ~members)
+        self.members = members
+
+        if len(added) + len(removed) > self.full_update_ratio * max(len(indices), 1):
+            self._upstream_count = np.bincount(graph.upstream_rows, weights=members[graph.upstream_idx],
+                                               minlength=len(graph.ids)).astype(np.int32)
+            self._downstream_count = np.bincount(graph.downstream_rows, weights=members[graph.downstream_idx],
+                                                 minlength=len(graph.ids)).astype(np.int32)
+            subgraph = np.flatnonzero(members)
+            self.inflow = set(subgraph[self._upstream_count[subgraph] == 0].tolist())
+            self.outflow = set(subgraph[self._downstream_count[subgraph] == 0].tolist())
+            return added, removed
+
+        affected = set(added.tolist()) | set(removed.tolist())
+        for edges, change in ((added, 1), (removed, -1)):
+            for i in edges:
+                downstream = graph.downstream_idx[graph.downstream_ptr[i]:graph.downstream_ptr[i + 1]]
+                upstream = graph.upstream_idx[graph.upstream_ptr[i]:graph.upstream_ptr[i + 1]]
+                self._upstream_count[downstream] += change
+                self._downstream_count[upstream] += change
+                affected.update(downstream.tolist())
+                affected.update(upstream.tolist())
+        for i in affected:
+            if members[i] and self._upstream_count[i] == 0:
+                self.inflow.add(i)
+            else:
+                self.inflow.discard(i)
+            if members[i] and self._downstream_count[i] == 0:
+                self.outflow.add(i)
+            else:
+                self.outflow.discard(i)
+        return added, removed
+
+
+class RoadDistanceIndex:
+    """
+        Per-edge neighbourhoods within a given road distance, found by bounded Dijkstra searches downstream and upstream
+        of the edge. Downstream edges are included if their start is within the distance from the end of the edge,
+        upstream edges are included if their end is within the distance from the start of the edge.
+
+        Args:
+            graph (object): EdgeGraph of the network
+            distance (float): road distance in meters
+            lazy (bool): if set, the neighbourhood of an edge is only searched at its first lookup. Otherwise, the whole
+                         index is built at once. Optional. Default: False.
+    """
+
+    def __init__(self, graph, distance, lazy=False):
+        self.graph = graph
+        self.distance = distance
+        self._neighbourhoods = [None] * len(graph.ids)
+        # Plain Python lists are faster to traverse than numpy arrays
+        self._lengths = graph.lengths.tolist()
+        self._successors = [a.tolist() for a in graph.successors]
+        self._predecessors = [a.tolist() for a in graph.predecessors]
+        if not lazy:
+            for i in range(len(graph.ids)):
+                self._neighbourhoods[i] = self._search(i)
+
+    def _bounded_dijkstra(self, start, adjacency, reached):
+        lengths = self._lengths
+        heap = [(0.0, i) for i in adjacency[start]]
+        heapq.heapify(heap)
+        settled = set()
+        while heap:
+            dist, i = heapq.heappop(heap)
+            if i in settled:
+                continue
+            settled.add(i)
+            if dist < reached.get(i, math.inf):
+                reached[i] = dist
+            next_dist = dist + lengths[i]
+            if next_dist <= self.distance:
+                for j in adjacency[i]:
+                    if j not in settled:
+                        heapq.heappush(heap, (next_dist, j))
+
+    def _search(self, i):
+        reached = {i: 0.0}
+        self._bounded_dijkstra(i, self._successors, reached)
+        self._bounded_dijkstra(i, self._predecessors, reached)
+        indices = np.array(sorted(reached), dtype=np.int32)
+        distances = np.array([reached[j] for j in indices.tolist()], dtype=np.float64)
+        return indices, distances
+
+    def neighbourhood(self, i):
+        """
+            Gets the edges within the road distance of an edge.
+
+            Args:
+                i (int): index of the edge in the EdgeGraph
+            Returns:
+                indices (numpy.ndarray: int): indices of the edges in the EdgeGraph
+                distances (numpy.ndarray: float): road distance of the edges
+        """
+        if self._neighbourhoods[i] is None:
+            self._neighbourhoods[i] = self._search(i)
+        return self._neighbourhoods[i]
+
+
+class MicroIsland:
+    """
+        State of a micro worker process kept by the main process: the EGOs it simulates, its step channel and its
+        subgraph.
+
+        Args:
+            worker (string): name of the worker process
+            channel (object): SharedStepChannel between the main, the meso and this micro worker process
+    """
+
+    def __init__(self, worker, channel):
+        self.worker = worker
+        self.channel = channel
+        self.ego_ids = ()
+        # EGOs in the order of the values published by the worker in the last step
+        self.published_ego_ids = ()
+        self.subgraph = []
+        # Subgraph, inflow and new edges computed, but not passed to the SUMO processes yet
+        self.pending_subgraph = dict()
+        self.boundary = None
+        self.entry_steps = None
+        self.update_ego_pos = None
+        self.update_ego_edges = None
+
+
+# Cell offsets of a 3x3 neighbourhood in a uniform grid
+_GRID_NEIGHBOURS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+
+class LibsumoParallelConnection:
+    """
+        An object to that handles a microscopic and a mesoscopic SUMO connection simultaneously.
+
+        The micro process subscribes to the road ID and position of every vehicle that departs in the microsimulation
+        (to the variables of VehicleStateFrame if the micro callback gets the frame, see start). Callbacks that
+        subscribe to vehicles of the microsimulation should include these variables.
+
+        With more than one micro worker, the EGOs are clustered spatially and every cluster is microsimulated by one
+        of the workers (island), with its own subgraph, against the shared meso simulation. Initially, every EGO is
+        assigned to the first worker, so they should be added by its callback. After each step, the clusters are
+        updated and EGOs are moved between the workers (see get_island_egos).
+
+        Args:
+            callback_micro (function): function that is executed periodically during the simulation accessing the
+                                       states of the microsimulation.
+            callback_meso (function): function that is executed periodically during the simulation accessing the states
+                                      of the meso simulation.
+            micro_workers (int): number of micro worker processes. Optional. Default: 1.
+            micro_callback_mode (string): 'control' executes the micro callback in the step, before the SUMO step, so
+                                          it can interact with the simulation and the step waits for it. 'observe'
+                                          executes it after the step in a helper thread of the worker, while the
+                                          worker waits for the next step. An observe callback gets the arguments set
+                                          by set_callback_arguments and the vehicle states after the step as keyword
+                                          argument frame (VehicleStateFrame), it must not use libsumo.
+                                          get_callback_returns returns a future of its return value. It needs a
+                                          callback. Optional. Default: 'control'.
+            meso_callback_mode (string): the same for the meso callback. Optional. Default: 'control'.
+    """
+
+    _VEHICLE_SUBSCRIPTION = (libsumo.constants.VAR_ROAD_ID, libsumo.constants.VAR_POSITION)
+    _INSERTION_STATISTICS = ('inserted', 'deferred', 'dropped', 'total_inserted', 'total_deferred', 'total_dropped')
+    # Attributes of the main and of the worker processes that are saved in a checkpoint (see save_state)
+    _MAIN_STATE = ('_step', '_migrations', '_subgraph_statistics', '_callback_step')
+    _MESO_STATE = ('_vehicles', '_published_vehicles', '_handoffs', '_route_cache', '_route_cache_hits',
+                   '_route_cache_misses', '_route_edges', '_island_routes', '_frozen', '_synced_routes',
+                   '_frame_results', '_removed_vehicles', '_callback_step')
+    _MICRO_STATE = ('_multi_ego_id', '_ego_pos', '_subgraph_edges', '_inflow_edges', '_vehicles', '_route_starts',
+                    '_insertion_queue', '_insertion_statistics', '_imported_routes', '_imported_egos',
+                    '_frame_results', '_removed_vehicles', '_callback_step', '_step', '_subgraph_statistics')
+
+    def __init__(self, callback_micro, callback_meso, micro_workers=1, micro_callback_mode='control',
+                 meso_callback_mode='control'):
+
+        if 'SUMO_HOME' in os.environ:
+            tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+            sys.path.append(tools)
+        else:
+            sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+        self.multi_ego = False
+        self._init_arguments = (callback_micro, callback_meso, micro_workers, micro_callback_mode, meso_callback_mode)
+        for mode, callback in ((micro_callback_mode, callback_micro), (meso_callback_mode, callback_meso)):
+            if mode not in ('control', 'observe'):
+                raise ValueError("callback modes must be 'control' or 'observe'")
+            if mode == 'observe' and callback is None:
+                raise ValueError("the observe callback mode needs a callback")
+        self._micro_callback_mode = micro_callback_mode
+        self._meso_callback_mode = meso_callback_mode
+
+        # Command pipes: each worker blocks on its end until it receives a command and acknowledges every command.
+        # The meso worker hands the vehicles entering the micro region over to the micro worker on a separate pipe.
+        if micro_workers < 1:
+            raise ValueError("micro_workers must be at least 1")
+        self._conns = dict()
+        self._pending = {'meso': 0}
+        self._conns['meso'], meso_conn = mp.Pipe()
+        workers = ['micro'] + [f'micro_{i}' for i in range(1, micro_workers)]
+        micro_conns = []
+        handoff_conns = []
+        for worker in workers:
+            self._pending[worker] = 0
+            self._conns[worker], micro_conn = mp.Pipe()
+            micro_conns.append(micro_conn)
+            handoff_conns.append(mp.Pipe(duplex=False))
+
+        # Static settings, set before the processes are started
+        self._ego_id = ''
+        self._multi_ego_id = ()
+        self._distance = 0.0
+        self._exit_distance = 0.0
+        self._min_residence_steps = 0
+        self._update_threshold = 0.0
+        self._lookahead_horizon = 0.0
+        self._removal_distance_factor = 1.5
+        self._subgraph_mode = 'circle'
+        self._island_merge_distance = 0.0
+        self._island_split_distance = 0.0
+        self._coupling_interval = 1
+        self._micro_substeps = 1
+        self._insertion_retries = 3
+        self._insertion_queue_size = 1000
+        self._sync_meso = False
+        self._freeze_meso = False
+        self._pipelined = False
+        self._subgraph_network = None
+        self._profile_capacity = 0
+        self._micro_vehicle_frame = False
+        self._meso_vehicle_frame = False
+        self._micro_callback_every_step = False
+
+        # State of the main process
+        self._network = None
+        self._graph = None
+        self._road_index = None
+        self._step = 0
+        self._migrations = []
+        self._subgraph_statistics = {'added': 0, 'removed': 0, 'total_added': 0, 'total_removed': 0,
+                                     'updates': 0, 'steps': 0}
+        self._command_bytes = 0
+        self._transfer_statistics = {'bytes': 0, 'total_bytes': 0, 'command_bytes': 0, 'regions': dict()}
+        self._profiler = StepProfiler()
+        self._profiles = None
+        self._callback_step = 0
+        # (micro, worker) -> step -> CallbackFuture of an observe callback, until it is resolved and the next step began
+        self._callback_futures = dict()
+        self._start_arguments = dict()
+        self._state_options = dict()  # worker -> SUMO options that load the state of a checkpoint (see restore)
+
+        # Every micro worker has its own step channel, the meso worker uses all of them. The values that only concern
+        # the meso worker are exchanged in the channel of the first micro worker.
+        self._islands = [MicroIsland(worker, self._create_channel()) for worker in workers]
+        self._channel = self._islands[0].channel
+        self._bytes_written = self._get_bytes_written()
+
+        self._sumo_micro = [mp.Process(target=self._control_sumo_micro_instance,
+                                       args=(callback_micro, micro_conn, handoff_recv, i), daemon=True)
+                            for i, (micro_conn, (handoff_recv, _)) in enumerate(zip(micro_conns, handoff_conns))]
+        self._sumo_meso = mp.Process(target=self._control_sumo_meso_instance,
+                                     args=(callback_meso, meso_conn, [send for _, send in handoff_conns]), daemon=True)
+
+    def __getstate__(self):
+        """
+            Leaves the process handles out of the pickled state. With the spawn start method, the connection is
+            pickled for every worker that is started, and the handles of the running workers cannot be pickled. The
+            workers do not use them.
+        """
+        state = self.__dict__.copy()
+        state['_sumo_meso'] = None  # remove from pickle
+        state['_sumo_micro'] = None  # remove from pickle
+        return state
+
+    @classmethod
+    def _create_channel(cls):
+        """
+            Creates the step channel of a micro worker with its initial values.
+
+            Returns:
+                channel (object): SharedStepChannel
+        """
+        # Values exchanged in every step. Edges are referenced by their index in the edge table (the sorted edge IDs
+        # of the network), vehicles by their index in the vehicle table, which is extended by the meso process as
+        # vehicles are handed over (new_vehicle_ids), and routes by their number in the route cache.
+        channel = SharedStepChannel({'callback_micro_return': 'object',
+                                     'callback_meso_return': 'object',
+                                     'ego_pos': 'floats',
+                                     'ego_edges': 'ints',
+                                     'ego_routes': 'int_records',
+                                     'ego_motion': 'floats',
+                                     'subgraph': 'ints',
+                                     'inflow': 'ints',
+                                     'new_links': 'ints',
+                                     'prev_inflow_ids': 'int_records',
+                                     'meso_routes': 'int_records',
+                                     'meso_vehs': 'ints',
+                                     'meso_veh_routes': 'ints',
+                                     'meso_veh_states': 'floats',
+                                     'micro_exits': 'floats',
+                                     'micro_entries': 'ints',
+                                     'new_vehicle_ids': 'ids',
+                                     'route_cache': 'floats',
+                                     'insertion': 'floats',
+                                     'subgraph_statistics': 'floats'})
+        channel.write_object('callback_micro_return', ())
+        channel.write_object('callback_meso_return', ())
+        channel.write_floats('ego_pos', [(0.0, 0.0)])
+        channel.write_ints('ego_edges', [-1])
+        channel.write_int_records('ego_routes', [])
+        channel.write_floats('ego_motion', np.zeros((0, 2)))
+        for name in ('subgraph', 'inflow', 'new_links'):
+            channel.write_ints(name, [])
+        channel.write_int_records('prev_inflow_ids', [])
+        channel.write_int_records('meso_routes', [])
+        channel.write_ints('meso_vehs', [])
+        channel.write_ints('meso_veh_routes', [])
+        channel.write_floats('meso_veh_states', np.zeros((0, 2)))
+        channel.write_floats('micro_exits', np.zeros((0, 4)))
+        channel.write_ints('micro_entries', [])
+        channel.write_ids('new_vehicle_ids', [])
+        channel.write_floats('route_cache', [(0, 0)])
+        channel.write_floats('insertion', np.zeros((1, len(cls._INSERTION_STATISTICS))))
+        channel.write_floats('subgraph_statistics', np.zeros((1, 3)))
+        return channel
+
+    def set_callback_arguments(self, arguments, micro, worker=None):
+        """
+            Passes the arguments of the optianal callback function as a tuple. The arguments are sent to the process
+            with a set-args command, which is acknowledged by the next step.
+
+            Args:
+                micro (bool): if set, the arguments in the microsimulator's process is set. If false, the mesoscopic
+                              simulator's callback arguments are set.
+                arguments (tuple): arguments of the callback function
+                worker (int): index of the micro worker whose arguments are set. Optional. Default: every micro
+                              worker.
+        """
+        if micro:
+            islands = self._islands if worker is None else [self._islands[worker]]
+            for island in islands:
+                self._send_command(island.worker, 'set_args', arguments)
+        else:
+            self._send_command('meso', 'set_args', arguments)
+
+    def get_callback_returns(self, micro, worker=0):
+        """
+            Gets the return values of the callback function as a tuple. It reads the shared memory. For an observe
+            callback, the future of the return value of the last step is returned.
+
+            Args:
+                micro (bool): if set, the return values in the microsimulator's process returned. If false, the
+                              mesoscopic simulator's callback return values are returned.
+                worker (int): index of the micro worker. Optional. Default: 0.
+            Returns:
+                values (tuple or object): return value of the callback function, or its CallbackFuture (None before
+                                          the first step)
+        """
+        futures = self._callback_futures.get((micro, worker if micro else 0))
+        if futures is not None:
+            return futures.get(self._callback_step)
+        if micro:
+            return self._islands[worker].channel.read_object('callback_micro_return')
+        else:
+            return self._channel.read_object('callback_meso_return')
+
+    def get_island_egos(self):
+        """
+            Gets the EGOs simulated by each micro worker in the next step. EGOs are moved between the workers at the
+            beginning of simulation_step, with their route, lane, position and speed.
+
+            Returns:
+                ego_ids (list: tuple): IDs of the EGOs of each micro worker
+        """
+        return [island.ego_ids for island in self._islands]
+
+    def get_subgraph_statistics(self):
+        """
+            Gets the churn of the microsimulated subgraph.
+
+            Returns:
+                statistics (dict): number of edges added to and removed from the subgraph in the last step ('added',
+                                   'removed') and in total ('total_added', 'total_removed'), number of subgraph
+                                   recomputations ('updates') and of steps ('steps')
+        """
+        return dict(self._subgraph_statistics)
+
+    def get_route_cache_statistics(self):
+        """
+            Gets the statistics of the route cache of the vehicle handoff from the meso to the micro simulation.
+
+            Returns:
+                statistics (dict): number of handed over vehicles whose route suffix was already interned ('hits') and
+                                   number of route suffixes interned ('misses')
+        """
+        hits, misses = self._channel.read_floats('route_cache')[0]
+        return {'hits': int(hits), 'misses': int(misses)}
+
+    def get_insertion_statistics(self):
+        """
+            Gets the statistics of the insertion of the handed over vehicles into the micro simulation.
+
+            Returns:
+                statistics (dict): number of vehicles inserted, deferred to the next exchange since they could not be
+                                   inserted, and dropped after too many retries or from a full insertion queue, in the
+                                   last step ('inserted', 'deferred', 'dropped') and in total ('total_inserted',
+                                   'total_deferred', 'total_dropped'), summed over the micro workers
+        """
+        values = np.sum([island.channel.read_floats('insertion')[0] for island in self._islands], axis=0)
+        return {key: int(value) for key, value in zip(self._INSERTION_STATISTICS, values)}
+
+    def get_transfer_statistics(self):
+        """
+            Gets the amount of data exchanged between the processes.
+
+            Returns:
+                statistics (dict): number of bytes written into the shared memory and sent as commands in the last step
+                                   ('bytes') and in total ('total_bytes'), of which command bytes in the last step
+                                   ('command_bytes'), and bytes written into each shared memory region in the last
+                                   step ('regions')
+        """
+        statistics = dict(self._transfer_statistics)
+        statistics['regions'] = dict(statistics['regions'])
+        return statistics
+
+    def get_profile(self):
+        """
+            Gets the phase records of the main and of the worker processes (see start, profile_capacity). After close,
+            the records collected when the connection was closed are returned.
+
+            Returns:
+                profiles (dict): process name ('main', 'meso', 'micro', 'micro_1', ...) -> records and phase names
+                                 (see StepProfiler.get_records)
+        """
+        if self._profiles is not None:
+            return self._profiles
+        return self._run_blocking(self._collect_profiles())
+
+    def get_profile_summary(self):
+        """
+            Summarizes the phase durations of each process.
+
+            Returns:
+                summary (dict): process name -> phase -> number of records ('count') and mean, median ('p50') and 99th
+                                percentile ('p99') of the duration in seconds
+        """
+        summary = dict()
+        for process, (records, phases) in self.get_profile().items():
+            durations = (records[:, 3] - records[:, 2]) / 1e9
+            summary[process] = dict()
+            for k, phase in enumerate(phases):
+                phase_durations = durations[records[:, 1] == k]
+                if not len(phase_durations):
+                    continue
+                summary[process][phase] = {'count': len(phase_durations),
+                                           'mean': float(np.mean(phase_durations)),
+                                           'p50': float(np.percentile(phase_durations, 50)),
+                                           'p99': float(np.percentile(phase_durations, 99))}
+        return summary
+
+    def export_profile_summary(self, path=None):
+        """
+            Writes the phase duration summary (see get_profile_summary) as a table.
+
+            Args:
+                path (string): output text file. Optional. Default: the table is written to the standard output.
+        """
+        lines = [f"{'process':>10} {'phase':>16} {'count':>8} {'mean [ms]':>10} {'p50 [ms]':>10} {'p99 [ms]':>10}\n"]
+        for process, phases in self.get_profile_summary().items():
+            for phase, values in phases.items():
+                lines.append(f"{process:>10} {phase:>16} {values['count']:8d} {values['mean'] * 1e3:10.3f} "
+                             f"{values['p50'] * 1e3:10.3f} {values['p99'] * 1e3:10.3f}\n")
+        if path is None:
+            sys.stdout.write(''.join(lines))
+        else:
+            with open(path, 'w') as f:
+                f.writelines(lines)
+
+    def export_profile_trace(self, path):
+        """
+            Writes the phase records as Chrome trace events (JSON), which can be opened by chrome://tracing or
+            Perfetto. Every process is shown as a separate track, the events carry the step number.
+
+            Args:
+                path (string): output JSON file
+        """
+        profiles = self.get_profile()
+        starts = [records[:, 2].min() for records, _ in profiles.values() if len(records)]
+        origin = min(starts) if starts else 0
+        events = []
+        for pid, (process, (records, phases)) in enumerate(profiles.items()):
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': process}})
+            for step, phase, start, end in records.tolist():
+                events.append({'name': phases[phase], 'ph': 'X', 'pid': pid, 'tid': 0, 'ts': (start - origin) / 1e3,
+                               'dur': (end - start) / 1e3, 'args': {'step': step}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    @_blocking
+    def start(self, cmd_micro, cmd_meso, ego_id, distance, subgraph_mode='circle', exit_distance=None,
+              min_residence_steps=0, update_threshold=0.0, lookahead_horizon=0.0, removal_distance_factor=1.5,
+              coupling_interval=1, meso_step_length=None, micro_step_length=None, insertion_retries=3,
+              insertion_queue_size=1000, sync_meso=False, freeze_meso=False, island_merge_distance=None,
+              island_split_distance=None, pipelined=False, subgraph_network=None, profile_capacity=0,
+              micro_vehicle_frame=False, meso_vehicle_frame=False, micro_callback_every_step=False):
+        """
+            Starts both processes and the SUMO instances as well. The two instances load the network and the routes in
+            parallel, this call returns when both are ready.
+
+            Args:
+                cmd_micro (list): SUMO command to start the microscopic simulation
+                cmd_meso (list): SUMO command to start the mesoscopic simulation
+                ego_id (string or list): name(s) of the ego vehicle(s)
+                distance (float): road distance in which microsimulation is used wrt the EGO coordinates. Only edges
+                                  within the range is simulated with car following dynamics
+                subgraph_mode (string): 'circle' selects the edges within the distance of the EGO position as the crow
+                                        flies, 'road' selects the edges reachable within the distance up- and
+                                        downstream of the EGO's edge. Optional. Default: 'circle'.
+                exit_distance (float): an edge already in the subgraph is only removed when it gets farther than this
+                                       distance (hysteresis). Optional. Default: distance.
+                min_residence_steps (int): minimum number of steps an edge stays in the subgraph. Optional. Default: 0.
+                update_threshold (float): the subgraph is only recomputed if an EGO moved more than this many meters
+                                          (or changed edge) since the last update. Optional. Default: 0.
+                lookahead_horizon (float): if positive, the edges on the remaining route of the EGO that it reaches
+                                           within this many seconds at its current speed are added to the subgraph
+                                           ahead of time, so vehicles are handed over gradually. Optional. Default: 0.
+                removal_distance_factor (float): vehicles of the microsimulation outside of the subgraph are removed if
+                                                 they are farther from every EGO than this factor times the distance.
+                                                 Optional. Default: 1.5.
+                coupling_interval (int): number of meso steps in each simulation_step. The micro instance takes the
+                                         steps of the same duration. The subgraph, the vehicle handoff and the callback
+                                         arguments and return values are only exchanged once per simulation_step, and
+                                         the callbacks are executed once, before the first of the steps. The vehicles
+                                         entering the micro region in the meso simulation between two exchanges are
+                                         handed over in a batch at the next exchange. Optional. Default: 1.
+                meso_step_length (float): step length of the meso simulation in seconds. It must be a multiple of the
+                                          micro step length: the micro instance takes as many sub-steps as needed to
+                                          reach the end of each meso step, so the handoffs happen at the meso steps.
+                                          Optional. Default: 1 s if micro_step_length is set, otherwise the step
+                                          lengths of the SUMO commands are kept and both instances take one step per
+                                          meso step.
+                micro_step_length (float): step length of the micro simulation in seconds. Optional. Default: 1 s if
+                                           meso_step_length is set.
+                insertion_retries (int): handed over vehicles are inserted into the micro simulation at their meso
+                                         position and speed. A vehicle that cannot be inserted (e.g., there is no gap)
+                                         is deferred to the next exchange, and dropped after this many retries.
+                                         Optional. Default: 3.
+                insertion_queue_size (int): maximum number of deferred vehicles, the oldest ones are dropped beyond it.
+                                            Optional. Default: 1000.
+                sync_meso (bool): if set, the vehicles leaving the micro region continue in the meso simulation from
+                                  their edge, position and speed in the micro simulation. Otherwise, the meso copy of
+                                  the vehicle, which was simulated in parallel, continues. Optional. Default: False.
+                freeze_meso (bool): if set, the meso copies of the vehicles inserted into the micro simulation are
+                                    taken out of the meso simulation until they leave the micro region, so they are
+                                    only simulated once. It needs sync_meso. Optional. Default: False.
+                island_merge_distance (float): with more than one micro worker, EGOs closer to each other than this
+                                               distance are simulated by the same worker. Optional. Default: twice the
+                                               exit distance, so the subgraphs of different workers do not overlap.
+                island_split_distance (float): EGOs simulated by the same worker are only separated when they get
+                                               farther from each other than this distance (hysteresis). Optional.
+                                               Default: 1.25 times island_merge_distance.
+                pipelined (bool): if set, the subgraph of the next step is computed by the main process and the
+                                  vehicles of the next handoff are collected by the meso process while the micro
+                                  workers are stepping, instead of before the step. The subgraph is then based on the
+                                  EGO positions of one step earlier, and the vehicles on the edges entering it are
+                                  handed over one step later. Optional. Default: False.
+                subgraph_network (string or object): .net file or NetworkIndex of the network. If set, every micro
+                                                     worker loads the network index and computes its subgraph from
+                                                     the positions of its EGOs at the end of its step, and only the
+                                                     inflow and new edges are passed to the meso process. The network
+                                                     argument of simulation_step is not used then. Optional.
+                profile_capacity (int): if positive, the main and the worker processes record the duration of the
+                                        phases of each step, and keep this many records each (see StepProfiler,
+                                        get_profile). Optional. Default: 0, the profiler is switched off.
+                micro_vehicle_frame (bool): if set, the micro callback gets the states of every micro vehicle at the
+                                            end of the last step as keyword argument frame (VehicleStateFrame). The
+                                            vehicles are subscribed to the variables of the frame. Optional. Default:
+                                            False.
+                meso_vehicle_frame (bool): the same for the meso callback and the meso vehicles. Optional. Default:
+                                           False.
+                micro_callback_every_step (bool): if set, the micro callback in control mode is executed before every
+                                                  micro step, e.g., every sub-step of a controller tested with the
+                                                  micro step length, instead of once per simulation_step. The return
+                                                  value of the last execution is returned, the vehicle state frame is
+                                                  updated before every execution. Optional. Default: False.
+            Returns:
+                timing (dict): startup time in seconds: spawning the processes ('spawn'), starting the micro SUMO
+                               instance, which only loads the network ('net_load'), the additional time the meso
+                               instance takes to start, mostly spent loading the routes ('route_load'), starting each
+                               instance ('micro_load', 'meso_load', the slowest one of the micro workers) and the whole
+                               call ('total')
+        """
+        arguments = dict(locals())
+        del arguments['self']
+        self._start_arguments = arguments
+        if subgraph_mode not in ('circle', 'road'):
+            raise ValueError("subgraph_mode must be 'circle' or 'road'")
+        if exit_distance is not None and exit_distance < distance:
+            raise ValueError("exit_distance must not be smaller than distance")
+        if coupling_interval < 1:
+            raise ValueError("coupling_interval must be at least 1")
+        if freeze_meso and not sync_meso:
+            raise ValueError("freeze_meso needs sync_meso")
+        if island_merge_distance is None:
+            island_merge_distance = 2 * (distance if exit_distance is None else exit_distance)
+        if island_split_distance is None:
+            island_split_distance = 1.25 * island_merge_distance
+        if island_split_distance < island_merge_distance:
+            raise ValueError("island_split_distance must not be smaller than island_merge_distance")
+        cmd_micro = list(cmd_micro)
+        cmd_meso = list(cmd_meso)
+        self._micro_substeps = 1
+        if meso_step_length is not None or micro_step_length is not None:
+            meso_step_length = 1.0 if meso_step_length is None else meso_step_length
+            micro_step_length = 1.0 if micro_step_length is None else micro_step_length
+            substeps = round(meso_step_length / micro_step_length)
+            if substeps < 1 or not math.isclose(substeps * micro_step_length, meso_step_length):
+                raise ValueError("meso_step_length must be a multiple of micro_step_length")
+            self._micro_substeps = substeps
+            cmd_meso = self._replace_options(cmd_meso, ['--step-length', str(meso_step_length)])
+            cmd_micro = self._replace_options(cmd_micro, ['--step-length', str(micro_step_length)])
+        self._subgraph_mode = subgraph_mode
+        self._exit_distance = distance if exit_distance is None else exit_distance
+        self._min_residence_steps = min_residence_steps
+        self._update_threshold = update_threshold
+        self._lookahead_horizon = lookahead_horizon
+        self._removal_distance_factor = removal_distance_factor
+        self._coupling_interval = int(coupling_interval)
+        self._insertion_retries = insertion_retries
+        self._insertion_queue_size = insertion_queue_size
+        self._sync_meso = sync_meso
+        self._freeze_meso = freeze_meso
+        self._island_merge_distance = island_merge_distance
+        self._island_split_distance = island_split_distance
+        self._pipelined = pipelined
+        self._subgraph_network = subgraph_network
+        self._profile_capacity = profile_capacity
+        self._profiler = StepProfiler(profile_capacity)
+        self._micro_vehicle_frame = micro_vehicle_frame
+        self._meso_vehicle_frame = meso_vehicle_frame
+        self._micro_callback_every_step = micro_callback_every_step
+        if self._micro_callback_mode == 'observe':
+            for k in range(len(self._islands)):
+                self._callback_futures[(True, k)] = dict()
+        if self._meso_callback_mode == 'observe':
+            self._callback_futures[(False, 0)] = dict()
+
+        if type(ego_id) is str:
+            self.multi_ego = False
+            self._ego_id = ego_id
+            self._islands[0].ego_ids = (ego_id,)
+        elif type(ego_id) is list:
+            self.multi_ego = True
+            self._multi_ego_id = tuple(ego_id)
+            self._islands[0].ego_ids = tuple(ego_id)
+        else:
+            raise TypeError("ego_id must be a string or a list of strings")
+        for island in self._islands:
+            island.published_ego_ids = island.ego_ids
+            island.channel.write_floats('ego_pos', np.zeros((len(island.ego_ids), 2)))
+            island.channel.write_ints('ego_edges', [-1] * len(island.ego_ids))
+        self._distance = distance
+
+        t_start = time.time()
+        self._sumo_meso.start()
+        self._send_command('meso', 'start', self._replace_options(cmd_meso, self._state_options.get('meso', [])))
+        # The handle of the running meso worker is reset in the state that is pickled for the micro workers (see
+        # __getstate__), it is kept here to stop the worker in close
+        for island, process in zip(self._islands, self._sumo_micro):
+            process.start()
+            self._send_command(island.worker, 'start',
+                               self._replace_options(cmd_micro, self._state_options.get(island.worker, [])))
+
+        # Readiness barrier: every instance is waited for, even if one of them failed
+        startup = dict()
+        errors = []
+        for worker in ['meso'] + [island.worker for island in self._islands]:
+            try:
+                startup[worker] = (yield worker)[-1]
+            except RuntimeError as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+        micro_load = max(startup[island.worker]['load'] for island in self._islands)
+        meso_load = startup['meso']['load']
+        return {'spawn': max(timing['ready'] for timing in startup.values()) - t_start,
+                'net_load': micro_load,
+                'route_load': max(meso_load - micro_load, 0.0),
+                'micro_load': micro_load,
+                'meso_load': meso_load,
+                'total': time.time() - t_start}
+
+    @_blocking
+    def close(self):
+        """
+            Stops sumo and kills the process. The processes are stopped and the shared memory is released even if a
+            worker failed, the first error is raised afterwards.
+        """
+        workers = ['meso'] + [island.worker for island in self._islands]
+        errors = []
+        try:
+            if self._profile_capacity:
+                self._profiles = yield from self._collect_profiles()
+            for micro, worker in self._callback_futures:
+                yield from self._collect_callback_returns(micro, worker)
+        except RuntimeError as e:
+            errors.append(e)
+        try:
+            for worker in workers:
+                self._send_command(worker, 'stop')
+            # Acknowledgements of commands that were not waited for because of an earlier error are received too
+            for worker in workers:
+                while self._pending[worker] > 0:
+                    try:
+                        yield worker
+                    except RuntimeError as e:
+                        errors.append(e)
+        finally:
+            for process in [self._sumo_meso] + self._sumo_micro:
+                if process.pid is None:
+                    continue
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            for island in self._islands:
+                island.channel.close(unlink=True)
+        if errors:
+            raise errors[0]
+
+    @_blocking
+    def save_state(self, path):
+        """
+            Writes a checkpoint of the co-simulation, e.g., after the warm-up. It is taken between two steps, after the
+            pending observe callbacks finished. The SUMO instances save their state (libsumo.simulation.saveState)
+            next to the checkpoint, as <path>.<worker>.xml.gz. The checkpoint keeps the state of the connection in
+            every process (subgraphs, vehicle tables, route cache, pending handoffs and insertions), the step channels
+            and the arguments of start. Subscriptions of the callbacks are not saved.
+
+            Args:
+                path (string): checkpoint file
+        """
+        for micro, worker in self._callback_futures:
+            yield from self._collect_callback_returns(micro, worker)
+        workers = ['meso'] + [island.worker for island in self._islands]
+        state_files = {worker: f"{os.path.basename(path)}.{worker}.xml.gz" for worker in workers}
+        for worker in workers:
+            self._send_command(worker, 'save_state', os.path.join(os.path.dirname(path), state_files[worker]))
+        worker_states = dict()
+        for worker in workers:
+            worker_states[worker] = (yield worker)[-1]
+        checkpoint = {'start': self._start_arguments,
+                      'state_files': state_files,
+                      'workers': worker_states,
+                      'channels': [island.channel.get_state() for island in self._islands],
+                      'main': {'attributes': {name: getattr(self, name) for name in self._MAIN_STATE},
+                               'islands': [self._get_island_state(island) for island in self._islands],
+                               'network': self._network}}
+        with open(path, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @_blocking
+    def restore(self, path, options=None):
+        """
+            Starts both processes and the SUMO instances from a checkpoint written by save_state, instead of start. The
+            SUMO instances load their state when they start, then the state of the connection is restored. The
+            connection needs the same callbacks and number of micro workers as the one that saved the checkpoint.
+
+            Args:
+                path (string): checkpoint file
+                options (list: string): further SUMO options of both instances as name and value pairs, e.g.,
+                                        ['--seed', '1'] for a branch with other random numbers. They replace the
+                                        options of the same name in the SUMO commands. Optional.
+            Returns:
+                timing (dict): startup time in seconds (see start) and the time of restoring the state of the
+                               connection ('restore')
+        """
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        workers = ['meso'] + [island.worker for island in self._islands]
+        if sorted(checkpoint['workers']) != sorted(workers):
+            raise ValueError("the checkpoint was saved with another number of micro workers")
+        self._state_options = {worker: ['--load-state', os.path.join(os.path.dirname(path), state_file),
+                                        '--begin', str(checkpoint['workers'][worker]['time'])] + list(options or [])
+                               for worker, state_file in checkpoint['state_files'].items()}
+        try:
+            timing = yield from LibsumoParallelConnection.start.__wrapped__(self, **checkpoint['start'])
+        finally:
+            self._state_options = dict()
+
+        t_restore = time.time()
+        for worker in workers:
+            self._send_command(worker, 'restore_state', checkpoint['workers'][worker])
+        for worker in workers:
+            yield worker
+        for island, channel_state in zip(self._islands, checkpoint['channels']):
+            island.channel.set_state(channel_state)
+        self._bytes_written = self._get_bytes_written()
+        for name, value in checkpoint['main']['attributes'].items():
+            setattr(self, name, value)
+        if checkpoint['main']['network'] is not None:
+            self._get_edge_graph(checkpoint['main']['network'])
+        for island, island_state in zip(self._islands, checkpoint['main']['islands']):
+            self._set_island_state(island, island_state)
+        timing['restore'] = time.time() - t_restore
+        timing['total'] += timing['restore']
+        return timing
+
+    def run_branches(self, path, branch, arguments, seeds=None, processes=None):
+        """
+            Runs branches of a checkpoint (see save_state) in parallel, e.g., Monte Carlo replicates after a shared
+            warm-up. Every branch runs in a forked process with a new connection, created with the callbacks and
+            the number of micro workers of this one and restored from the checkpoint. The branch function steps it,
+            the connection is closed after the function returned.
+
+            Args:
+                path (string): checkpoint file
+                branch (function): called as branch(parallel_conn, argument) in the branch process, e.g., with a seed or
+                                   an EGO controller as argument. Its return value is sent back, so it must be
+                                   picklable.
+                arguments (list): argument of each branch
+                seeds (list: int): SUMO seed of each branch. Optional. Default: the seed of the checkpoint.
+                processes (int): maximum number of branches running at the same time. Optional. Default: number of
+                                 CPUs divided by the number of SUMO instances of a branch, at least 1.
+            Returns:
+                results (list): return value of the branch function of each branch
+                timing (list: dict): startup time of each branch (see restore)
+        """
+        arguments = list(arguments)
+        if seeds is not None and len(seeds) != len(arguments):
+            raise ValueError("seeds must have one seed per branch")
+        if processes is None:
+            processes = max(os.cpu_count() // (len(self._islands) + 1), 1)
+        pending = list(range(len(arguments)))
+        running = dict()
+        results = [None] * len(arguments)
+        timing = [None] * len(arguments)
+        errors = []
+        while pending or running:
+            while pending and len(running) < processes:
+                k = pending.pop(0)
+                options = [] if seeds is None else ['--seed', str(seeds[k])]
+                result_recv, result_send = mp.Pipe(duplex=False)
+                process = mp.Process(target=self._run_branch, args=(path, branch, arguments[k], options, result_send))
+                process.start()
+                result_send.close()
+                running[result_recv] = (k, process)
+            for result_recv in mp.connection.wait(list(running)):
+                k, process = running.pop(result_recv)
+                try:
+                    status, value = result_recv.recv()
+                except EOFError:
+                    status, value = 'error', f"exit code {process.exitcode}"
+                process.join()
+                if status == 'error':
+                    errors.append(RuntimeError(f"Branch {k} failed:\n{value}"))
+                else:
+                    results[k], timing[k] = value
+        if errors:
+            raise errors[0]
+        return results, timing
+
+    @staticmethod
+    def _replace_options(cmd, options):
+        """
+            Sets options of a SUMO command. Options of the same name already in the command are removed with their
+            value.
+
+            Args:
+                cmd (list: string): SUMO command
+                options (list: string): option names and values, e.g., ['--seed', '1']
+            Returns:
+                cmd (list: string): SUMO command with the options
+        """
+        names = set(options[::2])
+        replaced = []
+        skip = False
+        for arg in cmd:
+            if skip:
+                skip = False
+            elif arg in names:
+                skip = True
+            else:
+                replaced.append(arg)
+        return replaced + list(options)
+
+    def _run_branch(self, path, branch, argument, options, result_conn):
+        """
+            Process of a branch (see run_branches).
+
+            Args:
+                path (string): checkpoint file
+                branch (function): branch function
+                argument (object): argument of the branch function
+                options (list: string): further SUMO options
+                result_conn (object): pipe end, the return value of the branch function and the startup time or the
+                                      traceback are sent on it
+        """
+        try:
+            parallel_conn = LibsumoParallelConnection(*self._init_arguments)
+            timing = parallel_conn.restore(path, options)
+            result = branch(parallel_conn, argument)
+            parallel_conn.close()
+        except Exception:
+            result_conn.send(('error', traceback.format_exc()))
+        else:
+            result_conn.send(('done', (result, timing)))
+        result_conn.close()
+
+    @_blocking
+    def simulation_step(self, network):
+        """
+            Steps the SUMO instance within the process. The meso instance takes coupling_interval steps, the micro
+            instance takes the sub-steps of the same duration (see start). In pipelined mode, the subgraph of the next
+            step is computed while the SUMO instances are stepping.
+
+            Args:
+                network (object): network object, not used if the micro workers compute the subgraphs (see start)
+        """
+        profiler = self._profiler
+        profiler.step += 1
+        t_step = t = profiler.clock()
+        self._callback_step += 1
+        for micro, worker in self._callback_futures:
+            # The resolved futures of the last steps are dropped, the pending ones are kept until they are resolved
+            futures = self._callback_futures[(micro, worker)]
+            for step in [step for step, future in futures.items() if future.done()]:
+                del futures[step]
+            self._callback_futures[(micro, worker)][self._callback_step] = \
+                CallbackFuture(lambda micro=micro, worker=worker:
+                               self._run_blocking(self._collect_callback_returns(micro, worker)))
+        yield from self._migrate_egos()
+        t = profiler.record('migrate', t)
+        if self._subgraph_network is not None:
+            # The micro workers compute their subgraphs at the end of their steps
+            self._send_steps()
+            t = profiler.record('send', t)
+        elif self._pipelined:
+            # The subgraph computed in the last step is published, the next one is computed during the step
+            self._publish_subgraphs()
+            ego_states = self._read_ego_states()
+            self._send_steps()
+            t = profiler.record('send', t)
+            self._update_subgraph(network, ego_states)
+            t = profiler.record('subgraph', t)
+        else:
+            self._update_subgraph(network, self._read_ego_states())
+            t = profiler.record('subgraph', t)
+            self._publish_subgraphs()
+            self._send_steps()
+            t = profiler.record('send', t)
+        yield 'meso'
+        t = profiler.record('wait_meso', t)
+        for island in self._islands:
+            yield island.worker
+            island.published_ego_ids = island.ego_ids
+        t = profiler.record('wait_micro', t)
+        if self._subgraph_network is not None:
+            self._read_subgraph_statistics()
+        for micro, worker in self._callback_futures:
+            channel = self._islands[worker].channel if micro else self._channel
+            self._resolve_callback_futures(micro, worker, channel.read_object(
+                'callback_micro_return' if micro else 'callback_meso_return'))
+        self._update_islands()
+        t = profiler.record('islands', t)
+        self._update_transfer_statistics()
+        profiler.record('statistics', t)
+        profiler.record('step', t_step)
+
+    def _send_steps(self):
+        """
+            Sends the step command to the meso and to every micro worker.
+        """
+        self._send_command('meso', 'step')
+        for island in self._islands:
+            self._send_command(island.worker, 'step')
+
+    def _get_bytes_written(self):
+        """
+            Gets the write counters of the shared memory regions, summed over the step channels.
+
+            Returns:
+                bytes_written (dict): region name -> bytes written
+        """
+        written = dict()
+        for island in self._islands:
+            for name, value in island.channel.bytes_written().items():
+                written[name] = written.get(name, 0) + value
+        return written
+
+    def _update_transfer_statistics(self):
+        """
+            Computes the bytes exchanged since the last step from the write counters of the shared memory regions and
+            the size of the commands sent.
+        """
+        written = self._get_bytes_written()
+        regions = {name: written[name] - self._bytes_written[name] for name in written}
+        self._bytes_written = written
+        step_bytes = sum(regions.values()) + self._command_bytes
+        self._transfer_statistics['bytes'] = step_bytes
+        self._transfer_statistics['total_bytes'] += step_bytes
+        self._transfer_statistics['command_bytes'] = self._command_bytes
+        self._transfer_statistics['regions'] = regions
+        self._command_bytes = 0
+
+    def _send_command(self, worker, cmd, payload=None):
+        """
+            Sends a command to a worker process without waiting for the acknowledgement.
+
+            Args:
+                worker (string): 'meso' or the name of a micro worker ('micro', 'micro_1', ...)
+                cmd (string): 'start', 'step', 'set_args', 'get_profile', 'collect_returns', 'save_state',
+                              'restore_state', 'stop', or 'export_egos' and 'import_egos' for a micro worker
+                payload (object): data of the command, e.g., the SUMO start command. Optional.
+        """
+        data = pickle.dumps((cmd, payload), protocol=pickle.HIGHEST_PROTOCOL)
+        self._conns[worker].send_bytes(data)
+        self._command_bytes += len(data)
+        self._pending[worker] += 1
+
+    def _wait_acknowledgements(self, worker):
+        """
+            Blocks until every command sent to the worker process is acknowledged.
+
+            Args:
+                worker (string): 'meso' or the name of a micro worker ('micro', 'micro_1', ...)
+            Returns:
+                values (list): values returned by the commands
+        """
+        values = []
+        while self._pending[worker] > 0:
+            values.append(self._receive_acknowledgement(worker))
+        return values
+
+    def _receive_acknowledgement(self, worker):
+        """
+            Receives the next acknowledgement of the worker process, blocks until it arrives.
+
+            Args:
+                worker (string): 'meso' or the name of a micro worker ('micro', 'micro_1', ...)
+            Returns:
+                value (object): value returned by the command
+        """
+        status, value = self._conns[worker].recv()
+        self._pending[worker] -= 1
+        if status == 'error':
+            raise RuntimeError(f"The {worker} SUMO process failed:\n{value}")
+        return value
+
+    def _run_blocking(self, phases):
+        """
+            Runs a generator that yields the workers whose acknowledgements it needs (see _blocking). The
+            acknowledgements are waited for and sent back to the generator, a failed worker raises the RuntimeError in
+            the generator.
+
+            Args:
+                phases (generator): generator of worker names
+            Returns:
+                value (object): return value of the generator
+        """
+        values = error = None
+        while True:
+            try:
+                worker = phases.send(values) if error is None else phases.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                values, error = self._wait_acknowledgements(worker), None
+            except RuntimeError as e:
+                values, error = None, e
+
+    def _resolve_callback_futures(self, micro, worker, returns):
+        """
+            Resolves the futures of the observe callbacks whose return values the worker reported. They are kept until
+            the next step, so get_callback_returns returns the same future until then.
+
+            Args:
+                micro (bool): micro or meso callback
+                worker (int): index of the micro worker, 0 for the meso worker
+                returns (list: tuple): step number, whether the callback succeeded and its return value or traceback
+        """
+        futures = self._callback_futures[(micro, worker)]
+        for step, succeeded, value in returns:
+            future = futures.get(step)
+            if future is None or future.done():
+                continue
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(f"The observe callback failed:\n{value}"))
+
+    def _collect_callback_returns(self, micro, worker):
+        """
+            Waits until the worker finished its observe callbacks and resolves their futures. Generator of the worker
+            to wait for (see _run_blocking).
+
+            Args:
+                micro (bool): micro or meso callback
+                worker (int): index of the micro worker, 0 for the meso worker
+        """
+        name = self._islands[worker].worker if micro else 'meso'
+        self._send_command(name, 'collect_returns')
+        self._resolve_callback_futures(micro, worker, (yield name)[-1])
+
+    def _collect_profiles(self):
+        """
+            Gets the phase records of every process. Generator of the workers to wait for (see _run_blocking).
+
+            Returns:
+                profiles (dict): process name -> records and phase names (see StepProfiler.get_records)
+        """
+        profiles = {'main': self._profiler.get_records()}
+        workers = ['meso'] + [island.worker for island in self._islands]
+        for worker in workers:
+            self._send_command(worker, 'get_profile')
+        for worker in workers:
+            profiles[worker] = (yield worker)[-1]
+        return profiles
+
+    def create_meso(self, sumocmd, meso_gui=False, meso_limited_jc=True, meso_overtaking=True, meso_options=None):
+        """
+            Takes the SUMO simulation configuration command and derives two variants of the SUMO config file
+            (.sumocfg): one with the mesosim option enabled (<simulation>_meso_<hash>.sumocfg) and one with the routes
+            removed (<simulation>_noRoutes_<hash>.sumocfg). The variants are written next to the original config,
+            named by a hash of its contents and of the options, so runs with the same config and options reuse them.
+            Returns SUMO start commands for the two simulations.
+
+            Args:
+                sumocmd (list: string): Sumo start configuration, e.g., ["sumo-gui", "-c", "test.sumocfg", "--start"]
+                meso_gui (bool): Start the meso simulation with a GUI. Optional. Default: False.
+                meso_limited_jc (bool): Limited junction control. See SUMO documentation for further description.
+                                        Optional. Default: True.
+                meso_overtaking (bool): Mesoscopic overtaking. See SUMO documentation for further description. Optional.
+                                        Default: True.
+                meso_options (dict): further SUMO options of the meso simulation, option name -> value, e.g.,
+                                     {'meso-edgelength': 50, 'meso-tls-penalty': 0.5}. Optional.
+            Returns:
+                micro_cmd (list: string): Sumo command to start the microscopic simulation
+                meso_cmd (list: string): Sumo command to start the mesoscopic simulation
+        """
+        config_name = ''
+        index = 0
+        for i, arg in enumerate(sumocmd):
+            if '.sumocfg' in arg:
+                config_name = arg
+                index = i
+        if not config_name:
+            raise ValueError("Please provide a .sumocfg file in the arguments")
+
+        options = {'meso-junction-control.limited': meso_limited_jc, 'meso-overtaking': meso_overtaking}
+        options.update(meso_options or {})
+        meso_config_name = self._create_meso_net(config_name, options)
+        micro_config_name = self._create_noflow_net(config_name)
+
+        meso_cmd = deepcopy(sumocmd)
+        if meso_gui is False:
+            meso_cmd[0] = "sumo"
+        else:
+            meso_cmd[0] = "sumo-gui"
+        meso_cmd[index] = meso_config_name
+
+        micro_cmd = deepcopy(sumocmd)
+        micro_cmd[index] = micro_config_name
+
+        return micro_cmd, meso_cmd
+
+    @staticmethod
+    def _create_meso_net(config_name, options):
+        """
+            Creates a mesoscopic simulation from the given sumo file.
+
+            Args:
+                config_name (string): Sumo config file
+                options (dict): SUMO options of the meso simulation, option name -> value
+            Returns:
+                meso_config_name (string): Name of the sumocfg file with meso simulation.
+        """
+        options = dict(options, mesosim=True)
+        return LibsumoParallelConnection._create_config_variant(config_name, '_meso', options, ())
+
+    @staticmethod
+    def _create_noflow_net(config_name):
+        """
+            Creates a microscpoic simulation without route files
+
+            Args:
+                config_name (string): Sumo config file
+            Returns:
+                micro_config_name (string): Name of the sumocfg file without routes.
+        """
+        return LibsumoParallelConnection._create_config_variant(config_name, '_noRoutes', dict(),
+                                                                ('route-files', 'mesosim'))
+
+    @staticmethod
+    def _create_config_variant(config_name, suffix, options, removed_options):
+        """
+            Derives a variant of a SUMO config file by setting and removing options (removed options take their SUMO
+            default value). Options that are not in the
+            config yet are added to its mesoscopic section. The variant is named by a hash of the config contents and
+            of the changes, and it is only written if it does not exist yet. It is written under a temporary name and
+            renamed, so concurrent runs never read a partially written file.
+
+            Args:
+                config_name (string): Sumo config file
+                suffix (string): appended to the config name, before the hash
+                options (dict): option name -> value to set
+                removed_options (tuple: string): names of the options to remove
+            Returns:
+                variant_name (string): name of the derived config file
+        """
+        with open(config_name, 'rb') as f:
+            contents = f.read()
+        changes = repr((sorted((name, str(value)) for name, value in options.items()), sorted(removed_options)))
+        digest = hashlib.sha256(contents + changes.encode()).hexdigest()[:12]
+        variant_name = "{}{}_{}{}".format(config_name[:-8], suffix, digest, config_name[-8:])
+        if os.path.exists(variant_name):
+            return variant_name
+
+        root = ElementTree.fromstring(contents)
+        for parent in list(root.iter()):
+            for element in list(parent):
+                if element.tag in removed_options:
+                    parent.remove(element)
+        for name, value in options.items():
+            value = str(value).lower() if isinstance(value, bool) else str(value)
+            elements = list(root.iter(name))
+            if not elements:
+                section = root.find('mesoscopic')
+                if section is None:
+                    section = ElementTree.SubElement(root, 'mesoscopic')
+                elements = [ElementTree.SubElement(section, name)]
+            for element in elements:
+                element.set('value', value)
+        if hasattr(ElementTree, 'indent'):  # Python 3.9+
+            ElementTree.indent(root)
+
+        tmp_name = f"{variant_name}.{os.getpid()}.tmp"
+        with open(tmp_name, 'wb') as f:
+            f.write(ElementTree.tostring(root, encoding='utf-8'))
+        os.replace(tmp_name, variant_name)
+        return variant_name
+
+    @staticmethod
+    def parse_network(network_file):
+        """
+            Parses the .net file to get a list of edge start/end locations in the scenario.
+
+            Args:
+                network_file (string): the network file
+            Returns:
+                network (object): network object
+        """
+        return readNet(network_file)
+
+    @staticmethod
+    def load_network_index(network_file, cache=True):
+        """
+            Loads the edge geometry and connectivity of the .net file without the sumolib network object. The network
+            is only parsed at the first run, the extracted index is cached next to the network file (see
+            NetworkIndex). It can be passed to simulation_step instead of the network object.
+
+            Args:
+                network_file (string): the network file
+                cache (bool): use and write the cache file. Optional. Default: True.
+            Returns:
+                network (object): NetworkIndex of the network, which serves the getEdge, getEdges and
+                                  getNeighboringEdges lookups of the sumolib network object
+        """
+        return NetworkIndex.load(network_file, cache)
+
+    def _update_subgraph(self, network, ego_states):
+        """
+            Updates the subgraphs where microsimulation takes place. Edges enter the subgraph within the distance and
+            leave it beyond the exit distance, but not before they spent the minimum residence time in it. The subgraph
+            of a micro worker is only recomputed if one of its EGOs moved more than the update threshold. The new
+            subgraphs are passed to the SUMO processes by _publish_subgraphs.
+
+            Args:
+                network (object): network object
+                ego_states (dict): EGO states (see _read_ego_states)
+        """
+        self._get_edge_graph(network)
+        self._step += 1
+        self._subgraph_statistics['steps'] += 1
+        self._subgraph_statistics['added'] = 0
+        self._subgraph_statistics['removed'] = 0
+        for island in self._islands:
+            self._update_island_subgraph(island, ego_states)
+
+    def _read_ego_states(self):
+        """
+            Reads the EGO states published by the micro workers in the last step.
+
+            Returns:
+                ego_states (dict): EGO ID -> position, edge (index in the EdgeGraph, -1 if not known or not in road
+                                   mode) and remaining route and motion (None if there is no lookahead)
+        """
+        ego_states = dict()
+        for island in self._islands:
+            ego_ids = island.published_ego_ids
+            ego_pos = island.channel.read_floats('ego_pos')
+            if self._subgraph_mode == 'road':
+                ego_edges = island.channel.read_ints('ego_edges').tolist()
+            else:
+                ego_edges = [-1] * len(ego_ids)
+            lookahead = dict()
+            if self._lookahead_horizon > 0:
+                for (k, route), motion in zip(island.channel.read_int_records('ego_routes'),
+                                              island.channel.read_floats('ego_motion')):
+                    lookahead[k] = (route, motion)
+            for k, ego_id in enumerate(ego_ids):
+                ego_states[ego_id] = (ego_pos[k], ego_edges[k], lookahead.get(k))
+        return ego_states
+
+    def _update_island_subgraph(self, island, ego_states):
+        """
+            Updates the subgraph of a micro worker.
+
+            Args:
+                island (object): MicroIsland of the worker
+                ego_states (dict): EGO states (see _read_ego_states)
+        """
+        network = self._network
+        states = [ego_states[ego_id] for ego_id in island.ego_ids]
+        ego_pos = np.array([state[0] for state in states], dtype=np.float64).reshape(-1, 2)
+        ego_edges = [state[1] for state in states] if self._subgraph_mode == 'road' else None
+
+        if self._update_threshold > 0 and island.update_ego_pos is not None and \
+                island.update_ego_pos.shape == ego_pos.shape and ego_edges == island.update_ego_edges and \
+                np.all(np.hypot(*(ego_pos - island.update_ego_pos).T) <= self._update_threshold):
+            island.pending_subgraph = {'new_links': []}
+            return
+        island.update_ego_pos = ego_pos
+        island.update_ego_edges = ego_edges
+
+        if self._subgraph_mode == 'road':
+            distances = self._get_microsimulation_subgraph_road(network, ego_pos, ego_edges)
+        else:
+            distances = self._get_microsimulation_subgraph_simplified(network, ego_pos)
+        if self._lookahead_horizon > 0:
+            self._add_lookahead_edges(distances, [state[2] for state in states if state[2] is not None])
+
+        members = island.boundary.members
+        entry_steps = island.entry_steps
+        subgraph = (distances <= self._distance) | \
+                   (members & (distances <= self._exit_distance)) | \
+                   (members & (self._step - entry_steps < self._min_residence_steps))
+        added, removed = self._set_subgraph(island, np.flatnonzero(subgraph))
+        entry_steps[added] = self._step
+
+        self._subgraph_statistics['added'] += len(added)
+        self._subgraph_statistics['removed'] += len(removed)
+        self._subgraph_statistics['total_added'] += len(added)
+        self._subgraph_statistics['total_removed'] += len(removed)
+        self._subgraph_statistics['updates'] += 1
+
+    def _add_lookahead_edges(self, distances, lookahead):
+        """
+            Marks the edges on the remaining routes of the EGOs that are reached within the lookahead horizon as
+            subgraph edges.
+
+            Args:
+                distances (numpy.ndarray: float): distance of every edge from the closest EGO, updated in place
+                lookahead (list: tuple): remaining route (edge indices) and motion (speed, lane position) of the EGOs
+        """
+        lengths = self._graph.lengths
+        for route, (speed, lane_position) in lookahead:
+            horizon = self._distance + speed * self._lookahead_horizon
+            offset = -lane_position
+            for i in route:
+                if offset > horizon:
+                    break
+                distances[i] = min(distances[i], self._distance)
+                offset += lengths[i]
+
+    def _get_microsimulation_subgraph_simplified(self, network, ego_pos):
+        """
+            Gets subgraph where microsimulation takes place - uses a circle of given radius instead of graph search.
+
+            Args:
+                network (object): NetworkIndex of the network
+                ego_pos (numpy.ndarray: float): EGO positions
+            Returns:
+                distances (numpy.ndarray: float): distance of every edge from the closest EGO, inf if farther than the
+                                                  exit distance
+        """
+        distances = np.full(len(self._graph.ids), np.inf)
+        for x, y in ego_pos:
+            indices, edge_distances = network.neighbouring_edges(x, y, self._exit_distance, include_junctions=True)
+            np.minimum.at(distances, indices, edge_distances)
+        return distances
+
+    def _get_microsimulation_subgraph_road(self, network, ego_pos, ego_edges):
+        """
+            Gets subgraph where microsimulation takes place - uses the edges within the road distance up- and
+            downstream of the EGO's edge. The neighbourhoods are looked up in an index built at the first call. If the
+            edge of an EGO is not known, the circle around its position is used.
+
+            Args:
+                network (object): NetworkIndex of the network
+                ego_pos (numpy.ndarray: float): EGO positions
+                ego_edges (list: int): edges of the EGOs (indices in the EdgeGraph, -1 if not known)
+            Returns:
+                distances (numpy.ndarray: float): road distance of every edge from the closest EGO, inf if farther than
+                                                  the exit distance
+        """
+        if self._road_index is None:
+            self._road_index = RoadDistanceIndex(self._graph, self._exit_distance)
+
+        distances = np.full(len(self._graph.ids), np.inf)
+        for pos, ego_edge in zip(ego_pos, ego_edges):
+            if ego_edge >= 0:
+                indices, edge_distances = self._road_index.neighbourhood(ego_edge)
+                np.minimum.at(distances, indices, edge_distances)
+            else:
+                distances = np.minimum(distances, self._get_microsimulation_subgraph_simplified(network, [pos]))
+        return distances
+
+    def _get_edge_graph(self, network):
+        """
+            Gets the integer indexed graph of the network, which is built at the first call. A sumolib network is
+            converted to a NetworkIndex first.
+
+            Args:
+                network (object): NetworkIndex or sumolib network object
+            Returns:
+                graph (object): EdgeGraph of the network
+        """
+        if self._graph is None:
+            if not isinstance(network, NetworkIndex):
+                network = NetworkIndex.from_sumolib(network)
+            self._network = network
+            self._graph = EdgeGraph(network)
+            for island in self._islands:
+                island.boundary = SubgraphBoundary(self._graph)
+                island.entry_steps = np.zeros(len(self._graph.ids), dtype=np.int64)
+        return self._graph
+
+    def _set_subgraph(self, island, indices):
+        """
+            Stores the new subgraph of a micro worker with its inflow and new edges until it is published.
+
+            Args:
+                island (object): MicroIsland of the worker
+                indices (numpy.ndarray: int): indices of the microsimulated edges in the EdgeGraph
+            Returns:
+                added (numpy.ndarray: int): indices of the edges that entered the subgraph
+                removed (numpy.ndarray: int): indices of the edges that left the subgraph
+        """
+        added, removed = island.boundary.update(indices)
+        island.subgraph = indices
+        island.pending_subgraph = {'subgraph': indices, 'inflow': sorted(island.boundary.inflow), 'new_links': added}
+        return added, removed
+
+    @staticmethod
+    def _get_island_state(island):
+        """
+            Gets the subgraph state of a micro worker for a checkpoint, without its step channel and EdgeGraph.
+
+            Args:
+                island (object): MicroIsland of the worker
+            Returns:
+                state (dict): attribute -> value, the attributes of the SubgraphBoundary as 'boundary'
+        """
+        state = {name: value for name, value in vars(island).items() if name not in ('worker', 'channel')}
+        if island.boundary is not None:
+            state['boundary'] = {name: value for name, value in vars(island.boundary).items() if name != 'graph'}
+        return state
+
+    @staticmethod
+    def _set_island_state(island, state):
+        """
+            Restores the subgraph state of a micro worker (see _get_island_state). The SubgraphBoundary of the island
+            has to be created first (see _get_edge_graph).
+
+            Args:
+                island (object): MicroIsland of the worker
+                state (dict): attribute -> value
+        """
+        state = dict(state)
+        boundary = state.pop('boundary')
+        vars(island).update(state)
+        if boundary is not None:
+            vars(island.boundary).update(boundary)
+
+    def _publish_subgraphs(self):
+        """
+            Passes the subgraphs computed since the last step to the SUMO processes.
+        """
+        for island in self._islands:
+            self._publish_subgraph(island)
+
+    @staticmethod
+    def _publish_subgraph(island):
+        """
+            Writes the subgraph values computed for a micro worker into its step channel.
+
+            Args:
+                island (object): MicroIsland of the worker
+        """
+        for name, values in island.pending_subgraph.items():
+            island.channel.write_ints(name, values)
+        island.pending_subgraph = dict()
+
+    def _read_subgraph_statistics(self):
+        """
+            Sums up the subgraph churn of the last step reported by the micro workers, which compute their subgraphs.
+        """
+        statistics = self._subgraph_statistics
+        added, removed, updates = np.sum([island.channel.read_floats('subgraph_statistics')[0]
+                                          for island in self._islands], axis=0).astype(int).tolist()
+        statistics['steps'] += 1
+        statistics['added'] = added
+        statistics['removed'] = removed
+        statistics['total_added'] += added
+        statistics['total_removed'] += removed
+        statistics['updates'] += updates
+
+    def _update_islands(self):
+        """
+            Clusters the EGOs spatially and assigns the clusters to the micro workers. EGOs closer to each other than
+            the merge distance are in the same cluster (single linkage), EGOs of the same worker are only separated
+            beyond the split distance. Larger clusters are assigned first, each to the worker that simulates most of
+            its EGOs if it does not get more than its share of the EGOs that way, otherwise to the least loaded worker.
+            EGOs that are not in the simulation stay with their worker. The EGOs that change worker are moved at the
+            beginning of the next step.
+        """
+        if len(self._islands) < 2:
+            return
+        ego_ids = [ego_id for island in self._islands for ego_id in island.ego_ids]
+        if not ego_ids:
+            return
+        ego_states = self._read_ego_states()
+        ego_pos = np.array([ego_states[ego_id][0] for ego_id in ego_ids], dtype=np.float64).reshape(-1, 2)
+        workers = np.array([k for k, island in enumerate(self._islands) for _ in island.ego_ids])
+        valid = np.isfinite(ego_pos).all(axis=1)
+
+        offsets = ego_pos[valid][:, np.newaxis, :] - ego_pos[valid][np.newaxis, :, :]
+        distances = np.hypot(offsets[:, :, 0], offsets[:, :, 1])
+        same_worker = workers[valid][:, np.newaxis] == workers[valid][np.newaxis, :]
+        linked = (distances < self._island_merge_distance) | ((distances < self._island_split_distance) & same_worker)
+        # Connected components: every EGO takes the smallest label among its links until nothing changes
+        labels = np.arange(len(linked))
+        while True:
+            new_labels = np.where(linked, labels[np.newaxis, :], len(linked)).min(axis=1)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+        assignment = workers.copy()
+        loads = np.bincount(workers[~valid], minlength=len(self._islands))
+        clusters = sorted((np.flatnonzero(valid)[labels == label] for label in np.unique(labels)), key=len,
+                          reverse=True)
+        capacity = max(-(-len(ego_ids) // len(self._islands)), len(clusters[0]) if clusters else 0)
+        for members in clusters:
+            counts = np.bincount(workers[members], minlength=len(self._islands))
+            for worker in np.argsort(-counts, kind='stable'):
+                if counts[worker] > 0 and loads[worker] + len(members) <= capacity:
+                    break
+            else:
+                worker = np.argmin(loads)
+            loads[worker] += len(members)
+            assignment[members] = worker
+
+        self._migrations = [(ego_id, int(src), int(dst)) for ego_id, src, dst in zip(ego_ids, workers, assignment)
+                            if src != dst]
+        for k, island in enumerate(self._islands):
+            island.ego_ids = tuple(ego_id for ego_id, worker in zip(ego_ids, assignment) if worker == k)
+
+    def _migrate_egos(self):
+        """
+            Moves the EGOs assigned to another micro worker: the old workers remove them and return their states, then
+            the new workers add them with the same route, lane, position and speed. Generator of the workers to wait
+            for (see _run_blocking).
+        """
+        if not self._migrations:
+            return
+        exports = dict()
+        for ego_id, src, _ in self._migrations:
+            exports.setdefault(src, []).append(ego_id)
+        for src, ego_ids in exports.items():
+            self._send_command(self._islands[src].worker, 'export_egos', ego_ids)
+        states = dict()
+        for src in exports:
+            states.update((yield self._islands[src].worker)[-1])
+
+        imports = dict()
+        for ego_id, src, dst in self._migrations:
+            imports.setdefault(src, [])
+            imports.setdefault(dst, [])
+            if states.get(ego_id) is not None:
+                imports[dst].append((ego_id, states[ego_id]))
+        for k, ego_states in imports.items():
+            island = self._islands[k]
+            self._send_command(island.worker, 'import_egos', (island.ego_ids, ego_states))
+        self._migrations = []
+
+    @staticmethod
+    def _serve_commands(conn, start, step, *step_args, commands=None):
+        """
+            Command loop of a worker process. Blocks until a command arrives, executes it and acknowledges it.
+
+            Args:
+                conn (object): worker end of the command pipe
+                start (function): starts the SUMO instance, called with the SUMO command. Its return value is sent
+                                  with the acknowledgement.
+                step (function): executes one simulation step, called with step_args and the callback arguments
+                step_args: positional arguments of step
+                commands (dict): further commands of the worker, command -> function called with the payload, whose
+                                 return value is sent with the acknowledgement. Optional.
+        """
+        commands = commands or dict()
+        callback_args = ()
+        while True:
+            cmd, payload = pickle.loads(conn.recv_bytes())
+            result = None
+            try:
+                if cmd == 'start':
+                    result = start(payload)
+                elif cmd == 'set_args':
+                    callback_args = payload
+                elif cmd == 'step':
+                    step(*step_args, callback_args)
+                elif cmd in commands:
+                    result = commands[cmd](payload)
+                elif cmd == 'stop':
+                    libsumo.close()
+                    conn.send((cmd, None))
+                    break
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+            else:
+                conn.send((cmd, result))
+
+    def _start_sumo_instance(self, cmd):
+        """
+            Starts the SUMO instance of a worker process and loads the edge table shared with the other processes.
+
+            Args:
+                cmd (list: string): SUMO start command
+            Returns:
+                timing (dict): time when the process received the command ('ready') and duration of starting SUMO in
+                               seconds ('load')
+        """
+        t_ready = time.time()
+        libsumo.start(cmd)
+        t_load = time.time() - t_ready
+        self._edges = IdTable(sorted(edge for edge in libsumo.edge.getIDList() if not edge.startswith(':')))
+        return {'ready': t_ready, 'load': t_load}
+
+    def _get_profile(self, payload=None):
+        """
+            Gets the phase records of the worker process.
+
+            Returns:
+                records (tuple): records and phase names (see StepProfiler.get_records)
+        """
+        return self._profiler.get_records()
+
+    def _run_callback(self, callback, callback_args):
+        """
+            Executes the callback of a worker process, with the vehicle state frame if it is used. The frame is filled
+            from the subscription results the worker got after its last step, without the vehicles it removed since.
+
+            Args:
+                callback (function): callback of the worker
+                callback_args (tuple): arguments set by set_callback_arguments
+            Returns:
+                callback_return (object): return value of the callback
+        """
+        if self._frame is None:
+            return callback(*callback_args)
+        t = self._profiler.clock()
+        self._frame.update(self._frame_results, self._removed_vehicles)
+        self._profiler.record('frame', t)
+        return callback(*callback_args, frame=self._frame)
+
+    def _start_observer(self, mode):
+        """
+            Starts the helper thread of the worker process that executes an observe callback.
+
+            Args:
+                mode (string): mode of the callback of the worker, 'control' or 'observe'
+        """
+        self._observer = ThreadPoolExecutor(max_workers=1) if mode == 'observe' else None
+        self._observations = deque()
+        self._callback_step = 0
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            self._observer.shutdown()
+
+    def _observe(self, callback, callback_args):
+        """
+            Submits the observe callback of the step to the helper thread with a snapshot of the vehicle states after
+            the step.
+
+            Args:
+                callback (function): callback of the worker
+                callback_args (tuple): arguments set by set_callback_arguments
+        """
+        self._callback_step += 1
+        if callback is None:
+            return
+        snapshot = VehicleStateFrame(max(len(self._frame_results), 1))
+        snapshot.update(self._frame_results, self._removed_vehicles)
+        self._observations.append((self._callback_step, self._observer.submit(callback, *callback_args,
+                                                                               frame=snapshot)))
+
+    def _get_observed_returns(self, wait=False):
+        """
+            Gets the return values of the finished observe callbacks in the order of the steps.
+
+            Args:
+                wait (bool): if set, the running and queued callbacks are waited for. Optional. Default: False.
+            Returns:
+                returns (list: tuple): step number, whether the callback succeeded and its return value or traceback
+        """
+        returns = []
+        while self._observations and (wait or self._observations[0][1].done()):
+            step, future = self._observations.popleft()
+            try:
+                returns.append((step, True, future.result()))
+            except Exception:
+                returns.append((step, False, traceback.format_exc()))
+        return returns
+
+    def _collect_returns(self, payload=None):
+        """
+            Waits for the observe callbacks of the worker process.
+
+            Returns:
+                returns (list: tuple): return values of the callbacks (see _get_observed_returns)
+        """
+        return self._get_observed_returns(wait=True)
+
+    def _control_sumo_meso_instance(self, callback, conn, handoff_conns):
+        self._vehicles = IdTable()
+        self._published_vehicles = 0
+        self._handoffs = self._create_handoffs()
+        self._route_cache = dict()
+        self._route_cache_hits = 0
+        self._route_cache_misses = 0
+        self._route_edges = dict()
+        self._island_routes = [set() for _ in self._islands]
+        self._frozen = dict()
+        self._synced_routes = 0
+        self._profiler = StepProfiler(self._profile_capacity)
+        self._start_observer(self._meso_callback_mode)
+        self._frame = VehicleStateFrame() if self._meso_vehicle_frame or self._observer else None
+        self._frame_results = dict()
+        self._removed_vehicles = set()
+        self._serve_commands(conn, self._start_sumo_instance, self._run_meso_step, callback, handoff_conns,
+                             commands={'get_profile': self._get_profile, 'collect_returns': self._collect_returns,
+                                       'save_state': self._save_meso_state, 'restore_state': self._restore_meso_state})
+        self._stop_observer()
+        for island in self._islands:
+            island.channel.close()
+
+    def _run_meso_step(self, callback, handoff_conns, callback_args):
+        """
+            Executes a step of the meso process. If it fails before the handoff is published, the micro workers are
+            still signalled, otherwise they would wait for the handoff and could not be stopped.
+
+            Args:
+                callback (function): callback of the meso process
+                handoff_conns (list: object): sending ends of the handoff pipes of the micro workers
+                callback_args (tuple): arguments set by set_callback_arguments
+        """
+        self._handoff_signalled = False
+        try:
+            self._step_meso_instance(callback, handoff_conns, callback_args)
+        except Exception:
+            if not self._handoff_signalled:
+                for handoff_conn in handoff_conns:
+                    handoff_conn.send(None)
+            raise
+
+    def _save_meso_state(self, path):
+        """
+            Saves the state of the meso instance and gets the state of the meso process for a checkpoint.
+
+            Args:
+                path (string): SUMO state file
+            Returns:
+                state (dict): simulation time ('time') and attribute -> value ('attributes')
+        """
+        libsumo.simulation.saveState(path)
+        return {'time': libsumo.simulation.getTime(),
+                'attributes': {name: getattr(self, name) for name in self._MESO_STATE}}
+
+    def _restore_meso_state(self, state):
+        """
+            Restores the state of the meso process after the meso instance loaded its state (see _save_meso_state).
+            The vehicles are subscribed again for the vehicle state frame.
+
+            Args:
+                state (dict): state of the meso process
+        """
+        for name, value in state['attributes'].items():
+            setattr(self, name, value)
+        if self._frame is not None:
+            for veh in libsumo.vehicle.getIDList():
+                libsumo.vehicle.subscribe(veh, VehicleStateFrame.VARIABLES)
+
+    def _create_handoffs(self):
+        """
+            Creates the empty handoff batches of the micro workers. The set of the vehicle IDs is shared by the batches,
+            so a vehicle is only handed over to one of the workers at an exchange.
+
+            Returns:
+                handoffs (list: tuple): batch of each micro worker (see _hand_over)
+        """
+        batch = set()
+        return [([], [], [], [], batch) for _ in self._islands]
+
+    def _step_meso_instance(self, callback, handoff_conns, callback_args):
+        profiler = self._profiler
+        profiler.step += 1
+        t = profiler.clock()
+        edge_ids = self._edges.ids
+        channels = [island.channel for island in self._islands]
+        if self._observer is not None:
+            self._channel.write_object('callback_meso_return', self._get_observed_returns())
+        # The subgraph values are read before the micro workers are signalled, they may write the next ones
+        inflows = [channel.read_ints('inflow').tolist() for channel in channels]
+        renders = [channel.read_ints('new_links').tolist() for channel in channels]
+
+        # Vehicles that left the micro simulation continue from their micro state, the ones that entered it are frozen
+        synced = []
+        for channel in channels:
+            if self._sync_meso:
+                synced += self._sync_micro_exits(channel.read_floats('micro_exits'))
+            if self._freeze_meso:
+                self._freeze_micro_entries(channel.read_ints('micro_entries').tolist())
+        t = profiler.record('sync', t)
+
+        micro_veh_ids = [dict(channel.read_int_records('prev_inflow_ids')) for channel in channels]
+        if self._pipelined:
+            # The batch was extracted at the end of the last step, while the micro workers were stepping. The vehicles
+            # that are on the inflow edges of the micro simulation since then are dropped from it.
+            micro_vehicles = set()
+            for island_veh_ids in micro_veh_ids:
+                for vehs in island_veh_ids.values():
+                    micro_vehicles.update(vehs)
+            self._drop_handoffs(micro_vehicles)
+        else:
+            self._extract_handoffs(inflows, renders, micro_veh_ids)
+        self._hand_over_synced(channels, synced)
+        t = profiler.record('handoff', t)
+
+        new_vehicle_ids = self._vehicles.ids[self._published_vehicles:]
+        for channel, (route_to_add, veh_to_add, veh_routes, veh_states, _) in zip(channels, self._handoffs):
+            channel.write_int_records('meso_routes', route_to_add)
+            channel.write_ints('meso_vehs', veh_to_add)
+            channel.write_ints('meso_veh_routes', veh_routes)
+            channel.write_floats('meso_veh_states', np.reshape(veh_states, (-1, 2)))
+            channel.write_ids('new_vehicle_ids', new_vehicle_ids)
+        self._channel.write_floats('route_cache', [(self._route_cache_hits, self._route_cache_misses)])
+        self._published_vehicles = len(self._vehicles)
+        self._handoffs = self._create_handoffs()
+
+        # Data is passed to the micro processes here. Now they run in parallel
+        for handoff_conn in handoff_conns:
+            handoff_conn.send(None)
+        self._handoff_signalled = True
+        t = profiler.record('publish', t)
+
+        # Callback function
+        if callback is not None and self._observer is None:
+            callback_return = self._run_callback(callback, callback_args)
+            self._channel.write_object('callback_meso_return', callback_return)
+            t = profiler.record('callback', t)
+
+        # Step the simulation. Between the exchanges, the vehicles entering the inflow edges are collected into the
+        # batch of the next exchange.
+        if self._coupling_interval > 1:
+            seen = [{edge: set(libsumo.edge.getLastStepVehicleIDs(edge_ids[edge])) for edge in island_inflows}
+                    for island_inflows in inflows]
+        for i in range(self._coupling_interval):
+            libsumo.simulationStep()
+            if self._frame is not None:
+                for veh in libsumo.simulation.getDepartedIDList():
+                    libsumo.vehicle.subscribe(veh, VehicleStateFrame.VARIABLES)
+            if i < self._coupling_interval - 1:
+                for k, island_inflows in enumerate(inflows):
+                    for edge in island_inflows:
+                        new_vehs = [veh for veh in libsumo.edge.getLastStepVehicleIDs(edge_ids[edge])
+                                    if veh not in seen[k][edge]]
+                        seen[k][edge].update(new_vehs)
+                        self._hand_over(new_vehs, edge, k)
+        if self._frame is not None:
+            self._frame_results = libsumo.vehicle.getAllSubscriptionResults()
+            self._removed_vehicles = set()
+        t = profiler.record('simulation_step', t)
+
+        # The batch of the next exchange is extracted while the micro workers are still stepping. The vehicles the
+        # micro workers had on their inflow edges at the start of the step are not handed over again.
+        if self._pipelined:
+            self._extract_handoffs(inflows, renders, micro_veh_ids)
+            t = profiler.record('extract', t)
+
+        if self._observer is not None:
+            self._observe(callback, callback_args)
+            profiler.record('observe', t)
+
+    def _extract_handoffs(self, inflows, renders, micro_veh_ids):
+        """
+            Hands the meso vehicles on the new edges and on the inflow edges of the subgraphs over to the micro workers.
+
+            Args:
+                inflows (list: list): inflow edge indices of each micro worker
+                renders (list: list): indices of the edges that entered the subgraph of each micro worker
+                micro_veh_ids (list: dict): inflow edge index -> indices of the vehicles on the edge in the micro
+                                            simulation, for each micro worker. These are not handed over again.
+        """
+        edge_ids = self._edges.ids
+        vehicle_index = self._vehicles.index
+        batch = self._handoffs[0][4]
+        for k, island_inflows in enumerate(inflows):
+            # To be rendered:
+            for edge in renders[k]:
+                meso_vehicles = libsumo.edge.getLastStepVehicleIDs(edge_ids[edge])
+                if not meso_vehicles:
+                    pass
+                else:
+                    self._hand_over([veh for veh in meso_vehicles if veh not in batch], edge, k)
+            # Inflows
+            for edge in island_inflows:
+                meso_vehicles = libsumo.edge.getLastStepVehicleIDs(edge_ids[edge])
+                if not meso_vehicles:
+                    pass
+                else:
+                    micro_vehicles = set(micro_veh_ids[k].get(edge, ()))
+                    self._hand_over([veh for veh in meso_vehicles
+                                     if veh not in batch and vehicle_index.get(veh) not in micro_vehicles], edge, k)
+
+    def _hand_over_synced(self, channels, synced):
+        """
+            Hands the vehicles synchronised onto the subgraph of a micro worker (e.g., leaving another micro worker)
+            over with their micro state, they are only inserted into the meso simulation at the next step.
+
+            Args:
+                channels (list: object): step channels of the micro workers
+                synced (list: tuple): vehicle ID, edge index, position and speed (see _sync_micro_exits)
+        """
+        if not synced:
+            return
+        batch = self._handoffs[0][4]
+        for k, channel in enumerate(channels):
+            subgraph = set(channel.read_ints('subgraph').tolist())
+            for veh, edge, position, speed in synced:
+                if edge in subgraph and veh not in batch:
+                    self._hand_over([veh], edge, k, [(position, speed)])
+
+    def _drop_handoffs(self, vehicles):
+        """
+            Removes vehicles from the handoff batches. The route definitions are kept, they are added anyway.
+
+            Args:
+                vehicles (set: int): indices of the vehicles in the vehicle table
+        """
+        if not vehicles:
+            return
+        vehicle_ids = self._vehicles.ids
+        for new_routes, batch_vehicles, vehicle_routes, vehicle_states, batch in self._handoffs:
+            keep = [k for k, veh in enumerate(batch_vehicles) if veh not in vehicles]
+            if len(keep) == len(batch_vehicles):
+                continue
+            for veh in batch_vehicles:
+                if veh in vehicles:
+                    batch.discard(vehicle_ids[veh])
+            batch_vehicles[:] = [batch_vehicles[k] for k in keep]
+            vehicle_routes[:] = [vehicle_routes[k] for k in keep]
+            vehicle_states[:] = [vehicle_states[k] for k in keep]
+
+    def _sync_micro_exits(self, exits):
+        """
+            Moves the meso copies of the vehicles that left the micro simulation to their micro state. The meso model
+            does not support moveTo, so the vehicle is replaced by one with the same ID and type on the rest of its
+            route, inserted at the micro position and speed. The position is only kept with segment granularity. The
+            meso copy is only replaced if the exit edge is on its remaining route, otherwise it continues unchanged.
+
+            Args:
+                exits (numpy.ndarray: float): vehicle index, edge index, position and speed of the vehicles
+            Returns:
+                synced (list: tuple): vehicle ID, edge index, position and speed of the vehicles added to the meso
+                                      simulation
+        """
+        vehicle_ids = self._vehicles.ids
+        edge_ids = self._edges.ids
+        synced = []
+        for veh_index, edge_index, position, speed in exits.tolist():
+            veh = vehicle_ids[int(veh_index)]
+            edge = edge_ids[int(edge_index)]
+            frozen = self._frozen.pop(veh, None)
+            if frozen is None:
+                try:
+                    route_index = libsumo.vehicle.getRouteIndex(veh)
+                    route = libsumo.vehicle.getRoute(veh)[max(route_index, 0):]
+                    type_id = libsumo.vehicle.getTypeID(veh)
+                except libsumo.TraCIException:
+                    continue  # the meso copy already arrived
+            else:
+                route, type_id = frozen
+            if edge not in route:
+                if frozen is not None:
+                    self._restore_meso_vehicle(veh, route, type_id)
+                continue
+            self._synced_routes += 1
+            route_id = f"_s{self._synced_routes}"
+            position = min(position, libsumo.lane.getLength(f"{edge}_0"))
+            try:
+                libsumo.route.add(route_id, route[route.index(edge):])
+            except libsumo.TraCIException:
+                if frozen is not None:
+                    self._restore_meso_vehicle(veh, route, type_id)
+                continue
+            if frozen is None:
+                self._remove_meso_vehicle(veh)
+            try:
+                libsumo.vehicle.add(veh, route_id, typeID=type_id, depart='now', departLane='best',
+                                    departPos=str(position), departSpeed=str(speed))
+            except libsumo.TraCIException:
+                self._restore_meso_vehicle(veh, route, type_id)
+                continue
+            synced.append((veh, int(edge_index), position, speed))
+        return synced
+
+    def _restore_meso_vehicle(self, veh, route, type_id):
+        """
+            Adds a vehicle that could not be synchronised back to the meso simulation, at the start of its remaining
+            route.
+
+            Args:
+                veh (string): ID of the vehicle
+                route (list: string): remaining route of the meso copy
+                type_id (string): vehicle type
+        """
+        self._synced_routes += 1
+        route_id = f"_s{self._synced_routes}"
+        try:
+            libsumo.route.add(route_id, route)
+            libsumo.vehicle.add(veh, route_id, typeID=type_id, depart='now')
+        except libsumo.TraCIException:
+            sys.stdout.write(f"Could not restore vehicle {veh} in the meso simulation\n")
+
+    def _freeze_micro_entries(self, entries):
+        """
+            Takes the meso copies of the vehicles inserted into the micro simulation out of the meso simulation. Their
+            remaining route and type are kept until they leave the micro region.
+
+            Args:
+                entries (list: int): indices of the vehicles in the vehicle table
+        """
+        vehicle_ids = self._vehicles.ids
+        for veh in entries:
+            veh = vehicle_ids[veh]
+            try:
+                route_index = libsumo.vehicle.getRouteIndex(veh)
+                route = libsumo.vehicle.getRoute(veh)[max(route_index, 0):]
+                type_id = libsumo.vehicle.getTypeID(veh)
+                self._remove_meso_vehicle(veh)
+            except libsumo.TraCIException:
+                continue
+            self._frozen[veh] = (route, type_id)
+
+    def _remove_meso_vehicle(self, veh):
+        """
+            Removes a vehicle from the meso simulation. If the vehicles are subscribed for the vehicle state frame, it
+            is unsubscribed first and left out of the frame.
+
+            Args:
+                veh (string): ID of the vehicle
+        """
+        if self._frame is not None:
+            libsumo.vehicle.unsubscribe(veh)
+            self._removed_vehicles.add(veh)
+        libsumo.vehicle.remove(veh)
+
+    def _hand_over(self, meso_vehicles, edge, island, states=None):
+        """
+            Adds meso vehicles to the batch of vehicles handed over to a micro worker at the next exchange. The batch
+            consists of the route definitions the worker does not have yet (route number, edge indices), the vehicle
+            indices, the route numbers, positions and speeds of the vehicles and the set of the vehicle IDs. The
+            position and the speed of the vehicles are recorded when they enter the edge, the meso simulation only
+            knows the position with the granularity of the segments and has no lanes.
+
+            Args:
+                meso_vehicles (list: string): IDs of the meso vehicles
+                edge (int): index of the edge where the vehicles enter the micro simulation in the edge table
+                island (int): index of the micro worker
+                states (list: tuple): position and speed of the vehicles, if they are not on the edge in the meso
+                                      simulation yet. Optional.
+        """
+        new_routes, vehicles, vehicle_routes, vehicle_states, batch = self._handoffs[island]
+        island_routes = self._island_routes[island]
+        for k, meso_veh in enumerate(meso_vehicles):
+            try:
+                route = self._get_handoff_route(meso_veh, edge)
+                if route < 0:
+                    continue
+                if states is None:
+                    state = (libsumo.vehicle.getLanePosition(meso_veh), libsumo.vehicle.getSpeed(meso_veh))
+                else:
+                    state = states[k]
+            except libsumo.TraCIException:
+                continue
+            if route not in island_routes:
+                island_routes.add(route)
+                new_routes.append((route, self._route_edges[route]))
+            vehicles.append(self._vehicles.add(meso_veh))
+            vehicle_routes.append(route)
+            vehicle_states.append(state)
+            batch.add(meso_veh)
+
+    def _get_handoff_route(self, meso_veh, edge):
+        """
+            Gets the route of a meso vehicle from the edge where it enters the micro simulation. Route suffixes are
+            interned by (meso route, entry edge): the first time a suffix is seen, it gets the next route number, which
+            is added to the micro simulations as route _r<number>. Later vehicles reference the same route.
+
+            Args:
+                meso_veh (string): ID of the meso vehicle
+                edge (int): index of the entry edge in the edge table
+            Returns:
+                route (int): number of the route suffix, -1 if it is shorter than two edges
+        """
+        meso_route = libsumo.vehicle.getRouteID(meso_veh)
+        route = self._route_cache.get((meso_route, edge))
+        if route is not None:
+            self._route_cache_hits += 1
+            return route
+        self._route_cache_misses += 1
+
+        edge_index = self._edges.index
+        route_edges = [edge_index[route_edge] for route_edge in libsumo.route.getEdges(meso_route)]
+        try:
+            index = route_edges.index(edge)
+        except ValueError:
+            pass
+        else:
+            route_edges = route_edges[index:]
+        if len(route_edges) < 2:
+            self._route_cache[(meso_route, edge)] = -1
+            return -1
+        route = self._route_cache_misses
+        self._route_cache[(meso_route, edge)] = route
+        self._route_edges[route] = route_edges
+        return route
+
+    def _control_sumo_micro_instance(self, callback, conn, handoff_conn, island):
+        island = self._islands[island]
+        self._island = island
+        self._channel = island.channel
+        if self.multi_ego:
+            self._multi_ego_id = island.ego_ids
+        if self._subgraph_network is not None:
+            network = self._subgraph_network
+            if isinstance(network, str):
+                network = NetworkIndex.load(network)
+            self._get_edge_graph(network)
+        self._subgraph_edges = set()
+        self._inflow_edges = []
+        self._ego_pos = self._channel.read_floats('ego_pos')
+        self._vehicles = IdTable()
+        self._route_starts = dict()
+        self._edge_lengths = dict()
+        self._insertion_queue = []
+        self._insertion_statistics = dict.fromkeys(self._INSERTION_STATISTICS, 0)
+        self._imported_routes = 0
+        self._imported_egos = dict()
+        self._profiler = StepProfiler(self._profile_capacity)
+        self._start_observer(self._micro_callback_mode)
+        self._frame = VehicleStateFrame() if self._micro_vehicle_frame or self._observer else None
+        self._frame_results = dict()
+        self._removed_vehicles = set()
+        self._vehicle_subscription = self._VEHICLE_SUBSCRIPTION if self._frame is None else VehicleStateFrame.VARIABLES
+        self._serve_commands(conn, self._start_sumo_instance, self._step_micro_instance, callback, handoff_conn,
+                             commands={'export_egos': self._export_egos, 'import_egos': self._import_egos,
+                                       'get_profile': self._get_profile, 'collect_returns': self._collect_returns,
+                                       'save_state': self._save_micro_state, 'restore_state': self._restore_micro_state})
+        self._stop_observer()
+        self._channel.close()
+
+    def _save_micro_state(self, path):
+        """
+            Saves the state of the micro instance and gets the state of the micro process for a checkpoint.
+
+            Args:
+                path (string): SUMO state file
+            Returns:
+                state (dict): simulation time ('time'), attribute -> value ('attributes') and the subgraph state if the
+                              worker computes its subgraph ('island')
+        """
+        libsumo.simulation.saveState(path)
+        return {'time': libsumo.simulation.getTime(),
+                'attributes': {name: getattr(self, name) for name in self._MICRO_STATE},
+                'island': None if self._subgraph_network is None else self._get_island_state(self._island)}
+
+    def _restore_micro_state(self, state):
+        """
+            Restores the state of the micro process after the micro instance loaded its state (see
+            _save_micro_state). The vehicles are subscribed again, the subscriptions are not saved by SUMO.
+
+            Args:
+                state (dict): state of the micro process
+        """
+        for name, value in state['attributes'].items():
+            setattr(self, name, value)
+        if state['island'] is not None:
+            self._set_island_state(self._island, state['island'])
+        for veh in libsumo.vehicle.getIDList():
+            libsumo.vehicle.subscribe(veh, self._vehicle_subscription)
+
+    def _export_egos(self, ego_ids):
+        """
+            Removes the EGOs that move to another micro worker from the micro simulation.
+
+            Args:
+                ego_ids (list: string): IDs of the EGOs
+            Returns:
+                states (list: tuple): EGO ID and state (see _get_vehicle_state), None if the EGO is not in the
+                                      simulation
+        """
+        states = []
+        for ego_id in ego_ids:
+            state = self._get_vehicle_state(ego_id)
+            try:
+                libsumo.vehicle.unsubscribe(ego_id)
+                libsumo.vehicle.remove(ego_id)
+            except libsumo.TraCIException:
+                state = None
+            states.append((ego_id, state))
+        self._removed_vehicles.update(ego_ids)
+        self._multi_ego_id = tuple(ego_id for ego_id in self._multi_ego_id if ego_id not in ego_ids)
+        return states
+
+    def _import_egos(self, payload):
+        """
+            Adds the EGOs moved from other micro workers with their route, lane, position and speed, and sets the EGOs
+            of this worker. An EGO that cannot be inserted with its speed until the end of the step is inserted with the
+            maximum safe speed instead (see _step_micro_instance).
+
+            Args:
+                payload (tuple): IDs of the EGOs of this worker and the EGO ID and state of the added EGOs
+        """
+        ego_ids, states = payload
+        for ego_id, (route, lane, position, speed, type_id) in states:
+            self._imported_routes += 1
+            route_id = f"_ego{self._imported_routes}"
+            try:
+                libsumo.route.add(route_id, route)
+                libsumo.vehicle.add(ego_id, route_id, typeID=type_id, depart='now', departLane=str(lane),
+                                    departPos=str(position), departSpeed=str(speed))
+            except libsumo.TraCIException:
+                sys.stdout.write(f"Could not move EGO {ego_id}\n")
+            else:
+                self._imported_egos[ego_id] = (route_id, type_id, lane, position)
+        self._multi_ego_id = tuple(ego_ids)
+
+    def _step_micro_instance(self, callback, handoff_conn, callback_args):
+        profiler = self._profiler
+        profiler.step += 1
+        t = profiler.clock()
+        if self._observer is not None:
+            self._channel.write_object('callback_micro_return', self._get_observed_returns())
+        handoff_conn.recv()
+        t = profiler.record('wait_handoff', t)
+
+        edge_ids = self._edges.ids
+        vehicle_ids = self._vehicles.ids
+        for veh in self._channel.read_ids('new_vehicle_ids'):
+            self._vehicles.add(veh)
+        if self._subgraph_network is None:
+            inflows = [edge_ids[edge] for edge in self._channel.read_ints('inflow').tolist()]
+            subgraph = {edge_ids[edge] for edge in self._channel.read_ints('subgraph').tolist()}
+        else:
+            inflows = self._inflow_edges
+            subgraph = self._subgraph_edges
+        distance = self._distance
+        new_routes = self._channel.read_int_records('meso_routes')
+        new_vehs = self._channel.read_ints('meso_vehs').tolist()
+        new_veh_routes = self._channel.read_ints('meso_veh_routes').tolist()
+        new_veh_states = self._channel.read_floats('meso_veh_states').tolist()
+
+        # Add routes, which are interned by the meso process, so each is new
+        for route, route_edges in new_routes:
+            try:
+                libsumo.route.add(f"_r{route}", [edge_ids[edge] for edge in route_edges])
+                self._route_starts[route] = edge_ids[route_edges[0]]
+            except libsumo.TraCIException:
+                pass
+        # Add vehicles: the ones deferred at the last exchanges first, then the new ones
+        queue = self._insertion_queue
+        for veh, route, (position, speed) in zip(new_vehs, new_veh_routes, new_veh_states):
+            queue.append((vehicle_ids[veh], route, position, speed, 0))
+        self._insertion_queue = []
+        added = self._insert_vehicles(queue)
+        ego_ids = self._multi_ego_id if self.multi_ego else (self._ego_id,)
+        t = profiler.record('insertion', t)
+
+        # Callback function
+        control = callback is not None and self._observer is None
+        if control:
+            callback_return = self._run_callback(callback, callback_args)
+            t = profiler.record('callback', t)
+
+        # Step the simulation, with sub-steps if its step length is shorter than the meso step length. The callback is
+        # executed before every sub-step if requested, with the vehicle states after the last sub-step.
+        entries = []
+        for k in range(self._coupling_interval * self._micro_substeps):
+            if k > 0 and control and self._micro_callback_every_step:
+                if self._frame is not None:
+                    self._frame_results = libsumo.vehicle.getAllSubscriptionResults()
+                    self._removed_vehicles = set()
+                callback_return = self._run_callback(callback, callback_args)
+            libsumo.simulationStep()
+            for veh in libsumo.simulation.getDepartedIDList():
+                libsumo.vehicle.subscribe(veh, self._vehicle_subscription)
+                if added.pop(veh, None) is not None:
+                    self._insertion_statistics['inserted'] += 1
+                    entries.append(self._vehicles.index[veh])
+                self._imported_egos.pop(veh, None)
+        if control:
+            self._channel.write_object('callback_micro_return', callback_return)
+        t = profiler.record('simulation_step', t)
+
+        # EGOs moved from another worker that could not be inserted with their speed
+        for ego_id, (route_id, type_id, lane, position) in self._imported_egos.items():
+            try:
+                libsumo.vehicle.remove(ego_id)
+                libsumo.vehicle.add(ego_id, route_id, typeID=type_id, depart='now', departLane=str(lane),
+                                    departPos=str(position), departSpeed='max')
+            except libsumo.TraCIException:
+                sys.stdout.write(f"Could not move EGO {ego_id}\n")
+        self._imported_egos = dict()
+
+        # Vehicles that could not be inserted until the next exchange are deferred
+        for veh, entry in added.items():
+            try:
+                libsumo.vehicle.remove(veh)
+            except libsumo.TraCIException:
+                continue
+            self._defer_insertion(entry)
+        self._update_insertion_statistics()
+        t = profiler.record('deferral', t)
+
+        # Data from the microsimulator needed by the meso sim in the next step
+        # (to avoid loss of synchronization). Vehicles that did not come from the meso sim are not in the table.
+        edge_index = self._edges.index
+        vehicle_index = self._vehicles.index
+        tmp_inflow_ids = []
+        for edge in inflows:
+            vehs = [vehicle_index[veh] for veh in libsumo.edge.getLastStepVehicleIDs(edge) if veh in vehicle_index]
+            tmp_inflow_ids.append((edge_index[edge], vehs))
+        self._channel.write_int_records('prev_inflow_ids', tmp_inflow_ids)
+
+        if self.multi_ego:
+            tmp_ego_pos_list = []
+            for ego_id in ego_ids:
+                try:
+                    tmp_ego_pos_list.append(libsumo.vehicle.getPosition(ego_id))
+                except libsumo.TraCIException:
+                    tmp_ego_pos_list.append((np.nan, np.nan))
+                    sys.stdout.write("EGO is not in the simulation\n")
+            self._ego_pos = np.array(tmp_ego_pos_list, dtype=np.float64).reshape(-1, 2)
+        else:
+            try:
+                self._ego_pos = np.array([libsumo.vehicle.getPosition(self._ego_id)], dtype=np.float64)
+            except libsumo.TraCIException:
+                sys.stdout.write("EGO is not in the simulation\n")
+        self._channel.write_floats('ego_pos', self._ego_pos)
+        t = profiler.record('publish', t)
+
+        # Clear links. The vehicles that came from the meso simulation are synchronised back to it with their state
+        # after the step, when the meso simulation is at the same time.
+        exits = []
+        vehicle_states = libsumo.vehicle.getAllSubscriptionResults()
+        ego_pos = self._ego_pos[np.isfinite(self._ego_pos).all(axis=1)]  # EGOs that are not in the simulation are NaN
+        removed = self._get_vehicles_out_of_range(vehicle_states, subgraph, ego_ids, ego_pos,
+                                                  distance * self._removal_distance_factor)
+        for veh in removed:
+            if self._sync_meso and veh in vehicle_index:
+                state = self._get_exit_state(veh, vehicle_states[veh][libsumo.constants.VAR_ROAD_ID])
+                if state is not None:
+                    edge, position, speed = state
+                    exits.append((vehicle_index[veh], edge_index[edge], position, speed))
+            try:
+                libsumo.vehicle.unsubscribe(veh)
+                libsumo.vehicle.remove(veh, reason=2)
+            except libsumo.TraCIException:
+                pass  # vehicle was already removed from another link.
+        self._channel.write_floats('micro_exits', np.reshape(exits, (-1, 4)))
+        if self._frame is not None:
+            self._frame_results = vehicle_states
+            self._removed_vehicles = set(removed)
+        if self._freeze_meso:
+            self._channel.write_ints('micro_entries', entries)
+        t = profiler.record('removal', t)
+
+        # The EGO states are passed to the main process, which computes the subgraph, or the subgraph is computed here
+        ego_edges = [-1] * len(ego_ids)
+        if self._subgraph_mode == 'road':
+            ego_edges = [edge_index.get(self._get_vehicle_edge(ego_id), -1) for ego_id in ego_ids]
+        lookahead = dict()
+        if self._lookahead_horizon > 0:
+            for k, ego_id in enumerate(ego_ids):
+                route, speed, lane_position = self._get_vehicle_lookahead(ego_id)
+                lookahead[k] = ([edge_index[edge] for edge in route if edge in edge_index], (speed, lane_position))
+        if self._subgraph_network is None:
+            if self._subgraph_mode == 'road':
+                self._channel.write_ints('ego_edges', ego_edges)
+            if self._lookahead_horizon > 0:
+                self._channel.write_int_records('ego_routes', [(k, route) for k, (route, _) in lookahead.items()])
+                self._channel.write_floats('ego_motion', [motion for _, motion in lookahead.values()])
+        else:
+            self._update_local_subgraph({ego_id: (self._ego_pos[k], ego_edges[k], lookahead.get(k))
+                                         for k, ego_id in enumerate(ego_ids)})
+        t = profiler.record('subgraph', t)
+
+        if self._observer is not None:
+            self._observe(callback, callback_args)
+            profiler.record('observe', t)
+
+    def _update_local_subgraph(self, ego_states):
+        """
+            Updates the subgraph of the micro worker from the states of its EGOs and passes the inflow and new edges to
+            the meso process. The subgraph itself is only passed with more than one micro worker, the meso process
+            needs it to hand over the vehicles leaving another worker.
+
+            Args:
+                ego_states (dict): EGO ID -> position, edge index and remaining route and motion (see _read_ego_states)
+        """
+        island = self._island
+        island.ego_ids = tuple(ego_states)
+        statistics = self._subgraph_statistics
+        statistics['added'] = 0
+        statistics['removed'] = 0
+        updates = statistics['updates']
+        self._step += 1
+        self._update_island_subgraph(island, ego_states)
+        if 'subgraph' in island.pending_subgraph:
+            edge_ids = self._edges.ids
+            self._subgraph_edges = {edge_ids[edge] for edge in island.pending_subgraph['subgraph']}
+            self._inflow_edges = [edge_ids[edge] for edge in island.pending_subgraph['inflow']]
+            if len(self._islands) < 2:
+                del island.pending_subgraph['subgraph']
+        self._publish_subgraph(island)
+        self._channel.write_floats('subgraph_statistics',
+                                   [(statistics['added'], statistics['removed'], statistics['updates'] - updates)])
+
+    def _insert_vehicles(self, entries):
+        """
+            Adds vehicles handed over by the meso simulation to the micro simulation at their position and speed in
+            the meso simulation (the meso simulation has no lanes, so the best lane is used). Deferred vehicles are
+            retried with the maximum safe speed. Vehicles already in the micro simulation are skipped, the ones that
+            cannot be added are deferred.
+
+            Args:
+                entries (list: tuple): vehicles to insert (vehicle ID, route number, position, speed, retries)
+            Returns:
+                added (dict): vehicle ID -> entry of the vehicles added, whose insertion is pending
+        """
+        added = dict()
+        present = set(libsumo.vehicle.getIDList()) if entries else ()
+        for entry in entries:
+            veh, route, position, speed, retries = entry
+            if veh in present:
+                continue
+            start = self._route_starts.get(route)
+            if start is None:
+                self._insertion_statistics['dropped'] += 1
+                continue
+            if start not in self._edge_lengths:
+                self._edge_lengths[start] = libsumo.lane.getLength(f"{start}_0")
+            position = min(max(position, 0.0), self._edge_lengths[start])
+            try:
+                libsumo.vehicle.add(veh, f"_r{route}", depart='now', departLane='best', departPos=str(position),
+                                    departSpeed=str(speed) if retries == 0 else 'max')
+            except libsumo.TraCIException:
+                self._defer_insertion(entry)
+            else:
+                added[veh] = entry
+        return added
+
+    def _defer_insertion(self, entry):
+        """
+            Puts a vehicle that could not be inserted into the insertion queue, or drops it if it was retried too many
+            times. If the queue is full, the oldest entries are dropped.
+
+            Args:
+                entry (tuple): vehicle to insert (vehicle ID, route number, position, speed, retries)
+        """
+        veh, route, position, speed, retries = entry
+        if retries >= self._insertion_retries:
+            self._insertion_statistics['dropped'] += 1
+            return
+        self._insertion_statistics['deferred'] += 1
+        self._insertion_queue.append((veh, route, position, speed, retries + 1))
+        if len(self._insertion_queue) > self._insertion_queue_size:
+            overflow = len(self._insertion_queue) - self._insertion_queue_size
+            del self._insertion_queue[:overflow]
+            self._insertion_statistics['dropped'] += overflow
+
+    def _update_insertion_statistics(self):
+        """
+            Publishes the insertion statistics of the last exchange and adds them to the totals.
+        """
+        statistics = self._insertion_statistics
+        for key in ('inserted', 'deferred', 'dropped'):
+            statistics['total_' + key] += statistics[key]
+        self._channel.write_floats('insertion', [[statistics[key] for key in self._INSERTION_STATISTICS]])
+        for key in ('inserted', 'deferred', 'dropped'):
+            statistics[key] = 0
+
+    @staticmethod
+    def _get_vehicles_out_of_range(vehicle_states, subgraph, ego_ids, ego_pos, radius):
+        """
+            Selects the vehicles of the micro simulation that are outside of the subgraph and farther from every EGO
+            than the given radius.
+
+            Args:
+                vehicle_states (dict): subscription results of the vehicles (road ID and position)
+                subgraph (set: string): microsimulated edges
+                ego_ids (tuple: string): IDs of the EGO vehicles, which are never selected
+                ego_pos (numpy.ndarray: float): EGO positions
+                radius (float): distance from the EGOs in meters
+            Returns:
+                vehicles (list: string): IDs of the selected vehicles
+        """
+        vehs = []
+        positions = []
+        for veh, state in vehicle_states.items():
+            if veh in ego_ids or state[libsumo.constants.VAR_ROAD_ID] in subgraph:
+                continue
+            vehs.append(veh)
+            positions.append(state[libsumo.constants.VAR_POSITION])
+        if not vehs:
+            return []
+        out_of_range = LibsumoParallelConnection._get_out_of_range_mask(np.array(positions), ego_pos, radius)
+        return [veh for veh, out in zip(vehs, out_of_range) if out]
+
+    @staticmethod
+    def _get_out_of_range_mask(positions, ego_pos, radius):
+        """
+            Checks which positions are farther from every EGO than the given radius. With more than a few EGOs, the
+            positions are first sorted into a uniform grid with the radius as cell size: positions outside of the 3x3
+            cells around every EGO are out of range without computing any distance. Exact distances are only computed
+            for the rest.
+
+            Args:
+                positions (numpy.ndarray: float): positions to check, shape (n, 2)
+                ego_pos (numpy.ndarray: float): EGO positions, shape (m, 2)
+                radius (float): distance from the EGOs in meters
+            Returns:
+                out_of_range (numpy.ndarray: bool): True for the positions out of range
+        """
+        out_of_range = np.ones(len(positions), dtype=bool)
+        if len(ego_pos) == 0 or len(positions) == 0:
+            return out_of_range
+        if len(ego_pos) > 4:
+            cells = np.floor(positions / radius).astype(np.int64)
+            ego_cells = np.floor(ego_pos / radius).astype(np.int64)
+            near_cells = (ego_cells[:, np.newaxis, :] + _GRID_NEIGHBOURS[np.newaxis, :, :]).reshape(-1, 2)
+            near = np.isin(cells[:, 0] * 2 ** 32 + cells[:, 1], near_cells[:, 0] * 2 ** 32 + near_cells[:, 1])
+        else:
+            near = out_of_range
+        if near.any():
+            offsets = positions[near][:, np.newaxis, :] - ego_pos[np.newaxis, :, :]
+            out_of_range[near] = np.all(np.einsum('ijk,ijk->ij', offsets, offsets) > radius ** 2, axis=1)
+        return out_of_range
+
+    @staticmethod
+    def _get_vehicle_edge(veh_id):
+        """
+            Gets the current (non-internal) edge of a vehicle in the micro simulation.
+
+            Args:
+                veh_id (string): ID of the vehicle
+            Returns:
+                edge_id (string): ID of the edge on the vehicle's route, empty if the vehicle is not in the simulation
+        """
+        try:
+            route_index = libsumo.vehicle.getRouteIndex(veh_id)
+            if route_index < 0:
+                return ''
+            return libsumo.vehicle.getRoute(veh_id)[route_index]
+        except libsumo.TraCIException:
+            return ''
+
+    @staticmethod
+    def _get_vehicle_state(veh_id):
+        """
+            Gets the state of a vehicle in the micro simulation that is needed to add it to another one. A vehicle on
+            an internal edge is placed at the start of the next edge of its route.
+
+            Args:
+                veh_id (string): ID of the vehicle
+            Returns:
+                state (tuple): remaining route (edge IDs), lane index ('best' on an internal edge), position on the lane
+                               in meters, speed in m/s and type ID, None if the vehicle is not in the simulation
+        """
+        try:
+            road_id = libsumo.vehicle.getRoadID(veh_id)
+            route = libsumo.vehicle.getRoute(veh_id)
+            route_index = libsumo.vehicle.getRouteIndex(veh_id)
+            lane = libsumo.vehicle.getLaneIndex(veh_id)
+            position = libsumo.vehicle.getLanePosition(veh_id)
+            speed = libsumo.vehicle.getSpeed(veh_id)
+            type_id = libsumo.vehicle.getTypeID(veh_id)
+        except libsumo.TraCIException:
+            return None
+        if not road_id or route_index < 0:
+            return None
+        if road_id.startswith(':'):
+            route_index += 1
+            lane = 'best'
+            position = 0.0
+        if route_index >= len(route):
+            return None
+        return list(route[route_index:]), lane, position, speed, type_id
+
+    @staticmethod
+    def _get_exit_state(veh_id, road_id):
+        """
+            Gets the state of a vehicle leaving the micro simulation. A vehicle on an internal edge is placed at the
+            start of the next edge of its route.
+
+            Args:
+                veh_id (string): ID of the vehicle
+                road_id (string): ID of the edge the vehicle is on
+            Returns:
+                state (tuple): edge ID, position on the edge in meters and speed in m/s, None if the vehicle has no
+                               next edge
+        """
+        try:
+            speed = libsumo.vehicle.getSpeed(veh_id)
+            if not road_id.startswith(':'):
+                return road_id, libsumo.vehicle.getLanePosition(veh_id), speed
+            route = libsumo.vehicle.getRoute(veh_id)
+            route_index = libsumo.vehicle.getRouteIndex(veh_id) + 1
+        except libsumo.TraCIException:
+            return None
+        if not 0 < route_index < len(route):
+            return None
+        return route[route_index], 0.0, speed
+
+    @staticmethod
+    def _get_vehicle_lookahead(veh_id):
+        """
+            Gets the remaining route and the motion of a vehicle in the micro simulation.
+
+            Args:
+                veh_id (string): ID of the vehicle
+            Returns:
+                route (list: string): edges of the route from the current edge on, empty if the vehicle is not in the
+                                      simulation
+                speed (float): speed of the vehicle in m/s
+                lane_position (float): position of the vehicle on its lane in meters
+        """
+        try:
+            route_index = libsumo.vehicle.getRouteIndex(veh_id)
+            if route_index < 0:
+                return [], 0.0, 0.0
+            route = list(libsumo.vehicle.getRoute(veh_id)[route_index:])
+            return route, libsumo.vehicle.getSpeed(veh_id), libsumo.vehicle.getLanePosition(veh_id)
+        except libsumo.TraCIException:
+            return [], 0.0, 0.0
+
+
+class AsyncLibsumoParallelConnection(LibsumoParallelConnection):
+    """
+        LibsumoParallelConnection for asyncio. start, restore, simulation_step, save_state, close and
+        get_callback_returns are coroutines that wait for the worker processes without blocking the event loop: the
+        command pipes are watched by the event loop and only read when an acknowledgement arrived. One event loop can
+        drive several co-simulations and other tasks without threads. The coroutines of a connection must not run
+        concurrently with each other, the other methods are the same as in LibsumoParallelConnection.
+
+        Args: see LibsumoParallelConnection
+    """
+
+    async def start(self, *args, **kwargs):
+        """
+            Starts both processes and the SUMO instances (see LibsumoParallelConnection.start).
+
+            Returns:
+                timing (dict): startup time in seconds (see LibsumoParallelConnection.start)
+        """
+        return await self._run_async(LibsumoParallelConnection.start.__wrapped__(self, *args, **kwargs))
+
+    async def simulation_step(self, network):
+        """
+            Steps the SUMO instances (see LibsumoParallelConnection.simulation_step).
+
+            Args:
+                network (object): network object, not used if the micro workers compute the subgraphs
+        """
+        await self._run_async(LibsumoParallelConnection.simulation_step.__wrapped__(self, network))
+
+    async def close(self):
+        """
+            Stops sumo and kills the process
+        """
+        await self._run_async(LibsumoParallelConnection.close.__wrapped__(self))
+
+    async def save_state(self, path):
+        """
+            Writes a checkpoint of the co-simulation (see LibsumoParallelConnection.save_state).
+
+            Args:
+                path (string): checkpoint file
+        """
+        await self._run_async(LibsumoParallelConnection.save_state.__wrapped__(self, path))
+
+    async def restore(self, path, options=None):
+        """
+            Starts both processes and the SUMO instances from a checkpoint (see LibsumoParallelConnection.restore).
+
+            Returns:
+                timing (dict): startup time in seconds (see LibsumoParallelConnection.restore)
+        """
+        return await self._run_async(LibsumoParallelConnection.restore.__wrapped__(self, path, options))
+
+    async def get_callback_returns(self, micro, worker=0):
+        """
+            Gets the return values of the callback function of the last step. The return value of an observe callback
+            is awaited: if the worker did not report it yet, it is fetched from the worker, which waits for the
+            callback to finish.
+
+            Args:
+                micro (bool): if set, the return values in the microsimulator's process returned. If false, the
+                              mesoscopic simulator's callback return values are returned.
+                worker (int): index of the micro worker. Optional. Default: 0.
+            Returns:
+                values (tuple or object): return value of the callback function
+        """
+        value = super().get_callback_returns(micro, worker)
+        if not isinstance(value, CallbackFuture):
+            return value
+        if not value.done():
+            await self._run_async(self._collect_callback_returns(micro, worker if micro else 0))
+        return value.result()
+
+    async def _run_async(self, phases):
+        """
+            Runs a generator that yields the workers whose acknowledgements it needs like _run_blocking, but waits for
+            the acknowledgements without blocking the event loop.
+
+            Args:
+                phases (generator): generator of worker names
+            Returns:
+                value (object): return value of the generator
+        """
+        values = error = None
+        while True:
+            try:
+                worker = phases.send(values) if error is None else phases.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                values, error = await self._wait_acknowledgements_async(worker), None
+            except RuntimeError as e:
+                values, error = None, e
+
+    async def _wait_acknowledgements_async(self, worker):
+        """
+            Waits until every command sent to the worker process is acknowledged. The event loop runs other tasks until
+            the command pipe becomes readable.
+
+            Args:
+                worker (string): 'meso' or the name of a micro worker ('micro', 'micro_1', ...)
+            Returns:
+                values (list): values returned by the commands
+        """
+        conn = self._conns[worker]
+        values = []
+        while self._pending[worker] > 0:
+            if not conn.poll():
+                loop = asyncio.get_running_loop()
+                readable = loop.create_future()
+                loop.add_reader(conn.fileno(), lambda: readable.done() or readable.set_result(None))
+                try:
+                    await readable
+                finally:
+                    loop.remove_reader(conn.fileno())
+            values.append(self._receive_acknowledgement(worker))
+        return values